@@ -1,15 +1,27 @@
-from typing import Optional
+import logging
+import os
+from typing import Generic, Optional, Type
 
 from pydantic import BaseModel
 from fastapi import HTTPException
 from uuid import UUID
 
 from fastapi_sessions.backends.implementations import InMemoryBackend
+from fastapi_sessions.backends.session_backend import (
+    BackendError,
+    SessionBackend,
+    SessionModel,
+)
+from fastapi_sessions.frontends.session_frontend import ID
 from fastapi_sessions.session_verifier import SessionVerifier
 from fastapi_sessions.frontends.implementations import SessionCookie, CookieParameters
 from starlette import status
 from starlette.requests import Request
 
+from database.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
 
 class SessionData(BaseModel):
     username: Optional[str]
@@ -18,6 +30,59 @@ class SessionData(BaseModel):
 
 
 cookie_params = CookieParameters(secure=True, samesite="none")
+session_ttl = int(os.environ.get("SESSION_TTL", cookie_params.max_age))
+
+
+class RedisBackend(Generic[ID, SessionModel], SessionBackend[ID, SessionModel]):
+    """Stores session data in Redis so every worker process sees the same sessions.
+
+    Keys expire after ``ttl`` seconds of inactivity: each read refreshes the TTL
+    in the same pipeline as the GET, so a lookup is still a single round trip.
+    Any client with the redis.asyncio interface works, e.g. fakeredis in tests.
+    """
+
+    def __init__(
+        self, client, model: Type[SessionModel], *, ttl: int, prefix: str = "session:"
+    ) -> None:
+        self._client = client
+        self._model = model
+        self._ttl = ttl
+        self._prefix = prefix
+
+    def _key(self, session_id: ID) -> str:
+        return f"{self._prefix}{session_id}"
+
+    async def create(self, session_id: ID, data: SessionModel):
+        """Create a new session entry."""
+        created = await self._client.set(
+            self._key(session_id), data.json(), ex=self._ttl, nx=True
+        )
+        if not created:
+            raise BackendError("create can't overwrite an existing session")
+
+    async def read(self, session_id: ID):
+        """Read an existing session data and prolong its TTL."""
+        async with self._client.pipeline(transaction=False) as pipe:
+            pipe.get(self._key(session_id))
+            pipe.expire(self._key(session_id), self._ttl)
+            raw, _ = await pipe.execute()
+        if raw is None:
+            return
+
+        return self._model.parse_raw(raw)
+
+    async def update(self, session_id: ID, data: SessionModel) -> None:
+        """Update an existing session."""
+        updated = await self._client.set(
+            self._key(session_id), data.json(), ex=self._ttl, xx=True
+        )
+        if not updated:
+            raise BackendError("session does not exist, cannot update")
+
+    async def delete(self, session_id: ID) -> None:
+        """Delete a session."""
+        await self._client.delete(self._key(session_id))
+
 
 # Uses UUID
 cookie = SessionCookie(
@@ -27,7 +92,22 @@ cookie = SessionCookie(
     secret_key="DONOTUSE",
     cookie_params=cookie_params,
 )
-backend = InMemoryBackend[UUID, SessionData]()
+
+# Without REDIS_URL sessions live in-process, which is only fit for a single
+# worker and for tests.
+if redis_client is not None:
+    backend = RedisBackend[UUID, SessionData](
+        redis_client, SessionData, ttl=session_ttl
+    )
+else:
+    backend = InMemoryBackend[UUID, SessionData]()
+    if int(os.environ.get("WORKERS") or 1) > 1:
+        logger.warning(
+            "REDIS_URL is not set, so each of the %s workers keeps its own sessions "
+            "and requests reaching another worker fail with 401. Set REDIS_URL or "
+            "run a single worker.",
+            os.environ["WORKERS"],
+        )
 
 
 class BasicVerifier(SessionVerifier[UUID, SessionData]):
@@ -36,7 +116,7 @@ class BasicVerifier(SessionVerifier[UUID, SessionData]):
         *,
         identifier: str,
         auto_error: bool,
-        backend: InMemoryBackend[UUID, SessionData],
+        backend: SessionBackend[UUID, SessionData],
         auth_http_exception: HTTPException,
     ):
         self._identifier = identifier
@@ -0,0 +1,30 @@
+"""room version
+
+Revision ID: 2f6d8a41c3b7
+Revises: 9b1e7c2d4a60
+Create Date: 2026-10-16 22:31:47.905532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2f6d8a41c3b7"
+down_revision = "9b1e7c2d4a60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("rooms"):
+        return
+    op.add_column(
+        "rooms",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("rooms", "version")
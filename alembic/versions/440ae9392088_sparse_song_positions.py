@@ -0,0 +1,47 @@
+"""sparse song positions
+
+Revision ID: 440ae9392088
+Revises: 51a314e901f9
+Create Date: 2026-10-16 21:14:07.709127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "440ae9392088"
+down_revision = "51a314e901f9"
+branch_labels = None
+depends_on = None
+
+
+# Must match db_methods.POSITION_STEP.
+POSITION_STEP = 1024
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("songs"):
+        return
+    op.alter_column("songs", "queue_num", new_column_name="position")
+    op.execute(f"UPDATE songs SET position = position * {POSITION_STEP}")
+    op.execute("DROP INDEX IF EXISTS ix_songs_room_id_queue_num")
+    op.create_index("ix_songs_room_id_position", "songs", ["room_id", "position"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_songs_room_id_position", table_name="songs")
+    op.execute(
+        """
+        UPDATE songs SET position = ranked.queue_num
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY room_id ORDER BY position)
+                AS queue_num
+            FROM songs
+        ) AS ranked
+        WHERE songs.id = ranked.id
+        """
+    )
+    op.alter_column("songs", "position", new_column_name="queue_num")
+    op.create_index("ix_songs_room_id_queue_num", "songs", ["room_id", "queue_num"])
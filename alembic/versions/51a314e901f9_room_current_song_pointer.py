@@ -0,0 +1,71 @@
+"""room current song pointer
+
+Revision ID: 51a314e901f9
+Revises: c999764ae1fd
+Create Date: 2026-10-16 21:12:15.284389
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "51a314e901f9"
+down_revision = "c999764ae1fd"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("songs"):
+        return
+    op.create_unique_constraint("songs_id_key", "songs", ["id"])
+    op.add_column("rooms", sa.Column("current_song_id", sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        "rooms_current_song_id_fkey",
+        "rooms",
+        "songs",
+        ["current_song_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+    op.execute(
+        """
+        UPDATE rooms SET current_song_id = playing.id
+        FROM (
+            SELECT DISTINCT ON (room_id) room_id, id FROM songs
+            WHERE status = 'is_playing'
+            ORDER BY room_id, queue_num DESC
+        ) AS playing
+        WHERE rooms.id = playing.room_id
+        """
+    )
+    op.execute("DROP INDEX IF EXISTS ix_songs_room_id_is_playing")
+    op.drop_column("songs", "status")
+    op.execute("DROP TYPE IF EXISTS songstate")
+
+
+def downgrade() -> None:
+    songstate = sa.Enum("in_queue", "is_playing", "played", name="songstate")
+    songstate.create(op.get_bind())
+    op.add_column("songs", sa.Column("status", songstate, nullable=True))
+    op.execute(
+        """
+        UPDATE songs SET status = CASE
+            WHEN current.id IS NULL OR songs.queue_num > current.queue_num
+                THEN 'in_queue'::songstate
+            WHEN songs.id = current.id THEN 'is_playing'::songstate
+            ELSE 'played'::songstate
+        END
+        FROM rooms LEFT JOIN songs AS current ON current.id = rooms.current_song_id
+        WHERE rooms.id = songs.room_id
+        """
+    )
+    op.execute(
+        "CREATE INDEX ix_songs_room_id_is_playing "
+        "ON songs (room_id) WHERE status = 'is_playing'"
+    )
+    op.drop_constraint("rooms_current_song_id_fkey", "rooms", type_="foreignkey")
+    op.drop_column("rooms", "current_song_id")
+    op.drop_constraint("songs_id_key", "songs", type_="unique")
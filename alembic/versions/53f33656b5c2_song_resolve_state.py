@@ -0,0 +1,35 @@
+"""song resolve state
+
+Revision ID: 53f33656b5c2
+Revises: 440ae9392088
+Create Date: 2026-10-16 21:32:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "53f33656b5c2"
+down_revision = "440ae9392088"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("songs"):
+        return
+    resolvestate = sa.Enum("ready", "resolving", "failed", name="resolvestate")
+    resolvestate.create(op.get_bind())
+    op.add_column(
+        "songs",
+        sa.Column(
+            "resolve_state", resolvestate, nullable=False, server_default="ready"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("songs", "resolve_state")
+    op.execute("DROP TYPE IF EXISTS resolvestate")
@@ -0,0 +1,31 @@
+"""playback clock
+
+Revision ID: 7c4e0b9d2a18
+Revises: 2f6d8a41c3b7
+Create Date: 2026-10-16 23:48:12.417305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7c4e0b9d2a18"
+down_revision = "2f6d8a41c3b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("rooms"):
+        return
+    op.add_column("rooms", sa.Column("playback_started_at", sa.DateTime(timezone=True)))
+    op.add_column("rooms", sa.Column("playback_paused_at", sa.DateTime(timezone=True)))
+    op.add_column("songs", sa.Column("duration", sa.Integer()))
+
+
+def downgrade() -> None:
+    op.drop_column("songs", "duration")
+    op.drop_column("rooms", "playback_paused_at")
+    op.drop_column("rooms", "playback_started_at")
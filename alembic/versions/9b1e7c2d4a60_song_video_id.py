@@ -0,0 +1,43 @@
+"""song video id and link expiry
+
+Revision ID: 9b1e7c2d4a60
+Revises: 53f33656b5c2
+Create Date: 2026-10-16 21:58:03.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9b1e7c2d4a60"
+down_revision = "53f33656b5c2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("songs"):
+        return
+    op.add_column("songs", sa.Column("video_id", sa.String(), nullable=True))
+    op.add_column(
+        "songs",
+        sa.Column("link_expires_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    # Existing songs only have the googlevideo link: keep it, with its expiry.
+    op.execute(
+        """
+        UPDATE songs SET link_expires_at = to_timestamp(
+            substring(link from '[?&]expire=([0-9]+)')::bigint
+        )
+        WHERE link ~ '[?&]expire=[0-9]+'
+        """
+    )
+    op.create_index("ix_songs_link_expires_at", "songs", ["link_expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_songs_link_expires_at", table_name="songs")
+    op.drop_column("songs", "link_expires_at")
+    op.drop_column("songs", "video_id")
@@ -0,0 +1,55 @@
+"""song history seq
+
+Revision ID: b8f2e4d61a95
+Revises: e5a1f73c90b4
+Create Date: 2026-10-17 10:12:41.530862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b8f2e4d61a95"
+down_revision = "e5a1f73c90b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("song_history"):
+        return
+    op.add_column("song_history", sa.Column("seq", sa.Integer(), nullable=True))
+    # Best guess for the songs archived so far: by archiving run, then playlist order.
+    op.execute(
+        """
+        UPDATE song_history SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY room_id ORDER BY archived_at, position, id
+            ) AS seq
+            FROM song_history
+        ) AS numbered
+        WHERE song_history.id = numbered.id
+        """
+    )
+    op.alter_column("song_history", "seq", nullable=False)
+    op.drop_index("ix_song_history_room_id_position", table_name="song_history")
+    op.create_index(
+        "ix_song_history_room_id_seq",
+        "song_history",
+        ["room_id", "seq"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_song_history_room_id_seq", table_name="song_history")
+    op.create_index(
+        "ix_song_history_room_id_position",
+        "song_history",
+        ["room_id", "position"],
+        unique=False,
+    )
+    op.drop_column("song_history", "seq")
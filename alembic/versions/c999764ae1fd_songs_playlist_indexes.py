@@ -0,0 +1,35 @@
+"""songs playlist indexes
+
+Revision ID: c999764ae1fd
+Revises: 
+Create Date: 2026-10-16 21:09:56.321946
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c999764ae1fd"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables, indexes included, from create_all.
+    if not sa.inspect(op.get_bind()).has_table("songs"):
+        return
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_songs_room_id_queue_num "
+        "ON songs (room_id, queue_num)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_songs_room_id_is_playing "
+        "ON songs (room_id) WHERE status = 'is_playing'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_songs_room_id_is_playing")
+    op.execute("DROP INDEX IF EXISTS ix_songs_room_id_queue_num")
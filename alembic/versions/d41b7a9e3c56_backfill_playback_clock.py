@@ -0,0 +1,33 @@
+"""backfill playback clock
+
+Revision ID: d41b7a9e3c56
+Revises: b8f2e4d61a95
+Create Date: 2026-10-17 10:48:03.271904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d41b7a9e3c56"
+down_revision = "b8f2e4d61a95"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fresh databases get the tables from create_all.
+    if not sa.inspect(op.get_bind()).has_table("rooms"):
+        return
+    # Rooms already playing when the clock was added have none: start it now.
+    op.execute(
+        """
+        UPDATE rooms SET playback_started_at = now()
+        WHERE current_song_id IS NOT NULL AND playback_started_at IS NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    pass
@@ -0,0 +1,55 @@
+"""song history
+
+Revision ID: e5a1f73c90b4
+Revises: 7c4e0b9d2a18
+Create Date: 2026-10-17 00:36:05.118294
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e5a1f73c90b4"
+down_revision = "7c4e0b9d2a18"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # Fresh databases get the tables from create_all.
+    if not inspector.has_table("songs"):
+        return
+    op.add_column("songs", sa.Column("played_at", sa.DateTime(timezone=True)))
+    if inspector.has_table("song_history"):
+        return
+    op.create_table(
+        "song_history",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("video_id", sa.String(), nullable=True),
+        sa.Column("link", sa.String(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=True),
+        sa.Column("avatar", sa.String(), nullable=True),
+        sa.Column("duration", sa.Integer(), nullable=True),
+        sa.Column("played_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("room_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="SET NULL"),
+        sa.ForeignKeyConstraint(["room_id"], ["rooms.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_song_history_room_id_position",
+        "song_history",
+        ["room_id", "position"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_song_history_room_id_position", table_name="song_history")
+    op.drop_table("song_history")
+    op.drop_column("songs", "played_at")
@@ -0,0 +1,89 @@
+"""
+Concurrent /get_playlist throughput benchmark.
+
+Run the API (``gunicorn -w 1 -k uvicorn.workers.UvicornWorker main:app``) against
+the database from ``.env`` and then::
+
+    python -m benchmarks.get_playlist_throughput --url http://localhost:8000
+
+Run it once on the commit before the async engine and once after it to compare.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from database.db import SessionLocal
+from db_methods.db_methods import POSITION_STEP
+from models import models
+
+
+def make_client(url: str, name: str) -> requests.Session:
+    client = requests.Session()
+    r = client.post(f"{url}/create_session")
+    r.raise_for_status()
+    # Cookie is issued with `secure`, so pass it explicitly for plain http.
+    client.headers["Cookie"] = f"cookie={r.cookies['cookie']}"
+    client.post(f"{url}/create_user", params={"name": name}).raise_for_status()
+    return client
+
+
+def seed_playlist(room_id: int, user_id: int, size: int):
+    db = SessionLocal()
+    try:
+        for i in range(size):
+            db.add(
+                models.Song(
+                    link=f"https://example.com/{i}",
+                    title=f"Song {i}",
+                    position=(i + 1) * POSITION_STEP,
+                    room_id=room_id,
+                    user_id=user_id,
+                )
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(url: str, clients: int, requests_per_client: int, playlist_size: int):
+    host = make_client(url, "host")
+    room = host.post(f"{url}/create_room", params={"name": "bench"}).json()
+    user = host.get(f"{url}/whoami").json()
+    seed_playlist(room["id"], user["userid"], playlist_size)
+
+    sessions = [host]
+    for i in range(clients - 1):
+        client = make_client(url, f"listener{i}")
+        client.post(f"{url}/connect", params={"room_id": room["id"]}).raise_for_status()
+        sessions.append(client)
+
+    def worker(client: requests.Session):
+        latencies = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            client.get(f"{url}/get_playlist").raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = sorted(sum(pool.map(worker, sessions), []))
+    elapsed = time.perf_counter() - started
+
+    print(f"clients={clients} playlist={playlist_size} requests={len(latencies)}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"p50: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--playlist-size", type=int, default=100)
+    args = parser.parse_args()
+    run(args.url, args.clients, args.requests, args.playlist_size)
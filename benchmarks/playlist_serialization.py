@@ -0,0 +1,92 @@
+"""
+Serializing a large playlist response.
+
+Compares the default FastAPI path (response model validation, ``jsonable_encoder``
+and ``json.dumps``) with ``ORJSONResponse``, with encoding the cached song
+records, and with reusing a body encoded for the same room version::
+
+    python -m benchmarks.playlist_serialization --size 1000 --number 50
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from models import models, schemas
+
+
+def make_playlist(size: int) -> list[models.Song]:
+    user = models.User(id=1, name="bench", session_id="bench", avatar=None)
+    songs = []
+    for i in range(size):
+        song = models.Song(
+            id=i + 1,
+            video_id=f"{i:011d}",
+            link=f"https://www.youtube.com/watch?v={i:011d}",
+            title=f"Song {i}",
+            avatar=f"https://i.ytimg.com/vi/{i:011d}/hqdefault.jpg",
+            resolve_state=models.ResolveState.ready,
+            user=user,
+        )
+        song.queue_num = i + 1
+        song.status = models.SongState.in_queue
+        songs.append(song)
+    return songs
+
+
+async def run(size: int, number: int):
+    songs = make_playlist(size)
+    field = create_response_field(name="playlist", type_=schemas.Playlist)
+
+    async def validated():
+        return await serialize_response(
+            field=field,
+            response_content=schemas.Playlist(songs=songs, version=1),
+            is_coroutine=True,
+        )
+
+    async def default():
+        return JSONResponse(await validated()).body
+
+    async def orjson_response():
+        return ORJSONResponse(await validated()).body
+
+    records = dict(songs=jsonable_encoder(await validated())["songs"], version=1)
+
+    async def cached_records():
+        return ORJSONResponse(records).body
+
+    bodies = {}
+
+    async def encoded_body():
+        key = "playlist:1:1"
+        if key not in bodies:
+            bodies[key] = ORJSONResponse(records).body
+        return bodies[key]
+
+    for name, render in (
+        ("default", default),
+        ("orjson", orjson_response),
+        ("records", cached_records),
+        ("encoded", encoded_body),
+    ):
+        started = time.perf_counter()
+        for _ in range(number):
+            body = await render()
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:>8}: {elapsed / number * 1000:.3f} ms/response, "
+            f"{len(body) / 1024:.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.size, args.number))
@@ -0,0 +1,109 @@
+"""
+Inserting songs at the head of a large queue.
+
+Compares the sparse ``position`` ordering with the old scheme that renumbered
+every later song on each insert. Uses the database from ``.env``::
+
+    python -m benchmarks.queue_head_insert --size 1000 --inserts 200
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import event, select
+
+from database.db import AsyncSessionLocal, async_engine
+from db_methods.db_methods import POSITION_STEP, get_insert_position
+from models import models
+
+
+async def create_room(size: int):
+    async with AsyncSessionLocal() as db:
+        user = models.User(name="bench", session_id=str(uuid.uuid4()))
+        room = models.Room(name="bench")
+        db.add_all([user, room])
+        await db.flush()
+        db.add_all(
+            models.Song(
+                link=f"https://example.com/{i}",
+                title=f"Song {i}",
+                position=(i + 1) * POSITION_STEP,
+                user=user,
+                room=room,
+            )
+            for i in range(size)
+        )
+        await db.commit()
+        return user.id, room.id
+
+
+async def insert_renumbering(room_id: int, user_id: int):
+    """What add_song did before: shift every later song by one."""
+    async with AsyncSessionLocal() as db:
+        playlist = (
+            (
+                await db.execute(
+                    select(models.Song).filter(models.Song.room_id == room_id)
+                )
+            )
+            .scalars()
+            .all()
+        )
+        for song in playlist:
+            song.position += POSITION_STEP
+        db.add(
+            models.Song(
+                link="https://example.com/new",
+                title="New",
+                position=POSITION_STEP,
+                user_id=user_id,
+                room_id=room_id,
+            )
+        )
+        await db.commit()
+
+
+async def insert_sparse(room_id: int, user_id: int):
+    async with AsyncSessionLocal() as db:
+        room = await db.get(models.Room, room_id)
+        position, _ = await get_insert_position(room, 0, db)
+        db.add(
+            models.Song(
+                link="https://example.com/new",
+                title="New",
+                position=position,
+                user_id=user_id,
+                room_id=room_id,
+            )
+        )
+        await db.commit()
+
+
+async def run(size: int, inserts: int):
+    rows = []
+
+    def count_updated_rows(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE"):
+            rows.append(len(parameters) if executemany else cursor.rowcount)
+
+    event.listen(async_engine.sync_engine, "after_cursor_execute", count_updated_rows)
+    for name, insert in (("renumber", insert_renumbering), ("sparse", insert_sparse)):
+        user_id, room_id = await create_room(size)
+        rows.clear()
+        started = time.perf_counter()
+        for _ in range(inserts):
+            await insert(room_id, user_id)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:>8}: {elapsed / inserts * 1000:.2f} ms/insert, "
+            f"{sum(rows) / inserts:.1f} rows updated/insert"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--inserts", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.size, args.inserts))
@@ -0,0 +1,144 @@
+import contextlib
+import os
+import threading
+import time
+
+import pytest
+
+# docker-compose.test.yml passes the test database as DATABASE_URL.
+if "DB_URL" not in os.environ and os.environ.get("DATABASE_URL"):
+    os.environ["DB_URL"] = os.environ["DATABASE_URL"]
+
+
+@pytest.fixture(scope="session")
+def async_engine():
+    if not os.environ.get("DB_URL"):
+        pytest.skip("DB_URL is not set")
+
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from database import db
+    from models import models
+
+    # TestClient runs each request in its own event loop, so asyncpg
+    # connections can't be pooled between requests.
+    engine = create_async_engine(db.async_db_url, poolclass=NullPool)
+    db.AsyncSessionLocal.configure(bind=engine)
+    models.Base.metadata.drop_all(bind=db.engine)
+    models.Base.metadata.create_all(bind=db.engine)
+    return engine
+
+
+@pytest.fixture(scope="session")
+def app(async_engine):
+    from main import app
+
+    return app
+
+
+@pytest.fixture
+def make_client(app):
+    from starlette.testclient import TestClient
+
+    def make(name: str = "user"):
+        # Session cookie is `secure`, so talk to the app over https.
+        client = TestClient(app, base_url="https://testserver")
+        client.post("/create_session").raise_for_status()
+        client.post("/create_user", params={"name": name}).raise_for_status()
+        return client
+
+    return make
+
+
+@pytest.fixture
+def make_room(make_client):
+    def make(name: str):
+        # The host's client, the room and the host's user id.
+        host = make_client(f"{name} host")
+        room = host.post("/create_room", params={"name": name}).json()
+        return host, room, host.get("/whoami").json()["userid"]
+
+    return make
+
+
+@pytest.fixture
+def seed_songs(async_engine):
+    from database.db import SessionLocal
+    from db_methods.db_methods import POSITION_STEP
+    from models import models
+
+    def seed(room_id: int, user_id: int, count: int):
+        db = SessionLocal()
+        try:
+            for i in range(count):
+                db.add(
+                    models.Song(
+                        link=f"https://example.com/{i}",
+                        title=f"Song {i}",
+                        position=(i + 1) * POSITION_STEP,
+                        room_id=room_id,
+                        user_id=user_id,
+                    )
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    return seed
+
+
+@pytest.fixture
+def count_statements(async_engine):
+    from sqlalchemy import event
+
+    @contextlib.contextmanager
+    def count():
+        statements = []
+
+        def on_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", on_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", on_execute)
+
+    return count
+
+
+@pytest.fixture
+def stub_resolver(monkeypatch, app):
+    from youtube import resolver
+    from youtube.cache import Cache
+
+    calls = []
+
+    def fetch_metadata(video_id):
+        calls.append(("metadata", video_id, threading.current_thread().name))
+        if video_id == "unavailable":
+            raise ValueError("Video unavailable")
+        return resolver.Metadata(
+            title=f"Title {video_id}",
+            avatar=resolver.thumbnail_url(video_id),
+            duration=180,
+        )
+
+    def fetch_stream_url(video_id):
+        calls.append(("stream", video_id, threading.current_thread().name))
+        expire = int(time.time()) + 6 * 3600
+        return (
+            f"https://rr1.googlevideo.com/videoplayback?id={video_id}&expire={expire}"
+        )
+
+    def fetch_playlist_video_ids(playlist_url, limit):
+        calls.append(("playlist", playlist_url, threading.current_thread().name))
+        return [f"{i:011d}" for i in range(limit)][:3]
+
+    monkeypatch.setattr(resolver, "fetch_metadata", fetch_metadata)
+    monkeypatch.setattr(resolver, "fetch_playlist_video_ids", fetch_playlist_video_ids)
+    monkeypatch.setattr(resolver, "fetch_stream_url", fetch_stream_url)
+    monkeypatch.setattr(resolver, "metadata_cache", Cache("test_meta", maxsize=8))
+    monkeypatch.setattr(resolver, "stream_cache", Cache("test_stream", maxsize=8))
+    return calls
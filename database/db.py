@@ -1,20 +1,27 @@
 from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 import os
 
 load_dotenv(".env")
 db_url = os.environ.get("DB_URL")
+async_db_url = os.environ.get(
+    "ASYNC_DB_URL", db_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+
+# Sync engine is used by alembic, create_all and celery tasks.
 engine = create_engine(db_url)
+async_engine = create_async_engine(async_db_url)
 
 Base = declarative_base()
 SessionLocal = sessionmaker(bind=engine)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, expire_on_commit=False
+)
 
 
-def get_db() -> Session:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncSession:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
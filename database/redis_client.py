@@ -0,0 +1,10 @@
+import os
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+redis_url = os.environ.get("REDIS_URL")
+
+# None means "run without Redis": callers fall back to in-process storage.
+redis_client = redis.from_url(redis_url) if redis_url else None
@@ -0,0 +1,43 @@
+import json
+import uuid
+from typing import Any, Optional
+
+from database.redis_client import redis_client
+
+TASK_TTL = 24 * 3600
+
+
+class TaskStore:
+    """Status of the jobs the API runs in the background, served by /tasks/{task_id}.
+
+    Statuses are Celery's (PROGRESS, SUCCESS, FAILURE), so clients poll every
+    task the same way. With a Redis client any process can answer for a task,
+    without one only the process that runs it.
+    """
+
+    def __init__(self, client=None, *, prefix: str = "task:") -> None:
+        self._client = client
+        self._prefix = prefix
+        self._tasks: dict[str, dict] = {}
+
+    @staticmethod
+    def new_id() -> str:
+        return str(uuid.uuid4())
+
+    async def set(self, task_id: str, status: str, result: Any = None) -> None:
+        task = dict(task_id=task_id, task_status=status, task_result=result)
+        if self._client is None:
+            self._tasks[task_id] = task
+        else:
+            await self._client.set(
+                f"{self._prefix}{task_id}", json.dumps(task), ex=TASK_TTL
+            )
+
+    async def get(self, task_id: str) -> Optional[dict]:
+        if self._client is None:
+            return self._tasks.get(task_id)
+        raw = await self._client.get(f"{self._prefix}{task_id}")
+        return json.loads(raw) if raw is not None else None
+
+
+task_store = TaskStore(redis_client)
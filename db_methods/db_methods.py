@@ -1,12 +1,24 @@
-from models import models
+import datetime
+from typing import NamedTuple, Optional
 
+from db_methods.playlist_cache import playlist_cache
+from models import models, schemas
+from youtube import resolver
+from youtube.resolver import Metadata
+
+import pytube.exceptions
+from pytube import extract
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.exc import IntegrityError, NoResultFound
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
 
 
-def create_user(avatar: str, name: str, session_id: str, db: Session):
+async def create_user(avatar: str, name: str, session_id: str, db: AsyncSession):
     try:
         user = models.User(name=name, avatar=avatar, session_id=session_id)
         db.add(user)
@@ -21,14 +33,14 @@ def create_user(avatar: str, name: str, session_id: str, db: Session):
     return user
 
 
-def create_room(name: str, password: str, user: models.User, db: Session):
+async def create_room(name: str, password: str, user: models.User, db: AsyncSession):
     try:
         room = models.Room(name=name, password=password)
         db.add(room)
-        db.flush()
+        await db.flush()
         a = models.Association(user=user, room=room, usertype=models.UserType.host)
         db.add(a)
-        db.commit()
+        await db.commit()
     except IntegrityError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -39,11 +51,13 @@ def create_room(name: str, password: str, user: models.User, db: Session):
     return room
 
 
-def get_user_by_session(session_id: str, db: Session):
+async def get_user_by_session(session_id: str, db: AsyncSession):
     try:
-        user: list[models.User] = (
-            db.query(models.User).filter(models.User.session_id == session_id).one()
-        )
+        user: models.User = (
+            await db.execute(
+                select(models.User).filter(models.User.session_id == session_id)
+            )
+        ).scalar_one()
         assert user, "There is no user for this session"
     except AssertionError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -58,34 +72,728 @@ def get_user_by_session(session_id: str, db: Session):
     return user
 
 
-def get_room_playlist(room: models.Room, db: Session):
+class Membership(NamedTuple):
+    user: models.User
+    association: Optional[models.Association]
+    room: Optional[models.Room]
+
+
+async def get_membership(session_id: str, db: AsyncSession) -> Membership:
+    """Loads the session's user together with its room association in one query."""
     try:
-        queue = (
-            db.query(models.Song)
-            .filter(
-                models.Song.room == room,
-                models.Song.status == models.SongState.in_queue,
+        user, association, room = (
+            await db.execute(
+                select(models.User, models.Association, models.Room)
+                .outerjoin(
+                    models.Association, models.Association.user_id == models.User.id
+                )
+                .outerjoin(models.Room, models.Room.id == models.Association.room_id)
+                .filter(models.User.session_id == session_id)
             )
-            .all()
+        ).one()
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="There is no user for this session",
         )
-        current: list = (
-            db.query(models.Song)
-            .filter(
-                models.Song.room == room,
-                models.Song.status == models.SongState.is_playing,
-            )
-            .all()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return Membership(user, association, room)
+
+
+async def lock_room(room: models.Room, db: AsyncSession):
+    """
+    Locks the room row until the end of the transaction, so changes of a room's queue run one at a time.
+
+    The room is reloaded, since the change that held the lock before may have moved its current song.
+    """
+    await db.execute(
+        select(models.Room)
+        .filter(models.Room.id == room.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+
+
+async def bump_room_version(room: models.Room, db: AsyncSession) -> int:
+    """
+    Increments the room version as part of the current transaction and returns it.
+
+    The row stays locked until commit, so concurrent changes of a room get distinct versions.
+    """
+    version = (
+        await db.execute(
+            update(models.Room)
+            .filter(models.Room.id == room.id)
+            .values(version=models.Room.version + 1)
+            .returning(models.Room.version)
+        )
+    ).scalar_one()
+    set_committed_value(room, "version", version)
+    return version
+
+
+# Songs are ordered by a sparse `position`, so a song can be put between two
+# others without renumbering the rest of the playlist. Clients only see the
+# dense 1-based `queue_num`, derived from the order.
+POSITION_STEP = 1024
+
+
+def queue_num_column():
+    """Scalar subquery computing a song's `queue_num` from its position."""
+    earlier = aliased(models.Song)
+    return (
+        select(func.count())
+        .filter(
+            earlier.room_id == models.Song.room_id,
+            earlier.position <= models.Song.position,
         )
-        played = (
-            db.query(models.Song)
-            .filter(
-                models.Song.room == room, models.Song.status == models.SongState.played
+        .scalar_subquery()
+    )
+
+
+async def get_room_playlist(room: models.Room, db: AsyncSession):
+    try:
+        playlist = (
+            (
+                await db.execute(
+                    select(models.Song)
+                    .options(joinedload(models.Song.user))
+                    .filter(models.Song.room == room)
+                    .order_by(models.Song.position)
+                )
             )
+            .scalars()
             .all()
         )
-        playlist = played + current + queue
-    except NoResultFound:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-    return sorted(playlist, key=lambda x: x.queue_num)
+    for queue_num, song in enumerate(playlist, start=1):
+        song.queue_num = queue_num
+    current = next((i for i in playlist if i.id == room.current_song_id), None)
+    return set_song_states(playlist, current)
+
+
+async def get_cached_playlist(room: models.Room, db: AsyncSession) -> list[dict]:
+    """
+    Returns the room playlist as **Song** dicts.
+
+    The playlist cache answers if it holds the playlist of the current room version.
+    """
+    songs = await playlist_cache.playlist(room.id, room.version)
+    if songs is None:
+        playlist = await get_room_playlist(room, db)
+        songs = jsonable_encoder([schemas.Song.from_orm(song) for song in playlist])
+        await playlist_cache.store(room.id, room.version, room.current_song_id, songs)
+    return songs
+
+
+def set_song_states(songs: list[models.Song], current: Optional[models.Song]):
+    """
+    Derives `status` of every song from its position relative to the room's current song.
+
+    Songs before the current one are played, songs after it are in queue.
+    """
+    for song in songs:
+        if current is None or song.position > current.position:
+            song.status = models.SongState.in_queue
+        elif song.id == current.id:
+            song.status = models.SongState.is_playing
+        else:
+            song.status = models.SongState.played
+    return songs
+
+
+async def _get_song_with_queue_num(query, db: AsyncSession):
+    row = (
+        await db.execute(
+            query.add_columns(queue_num_column()).options(joinedload(models.Song.user))
+        )
+    ).one_or_none()
+    if row is None:
+        return None
+    song, queue_num = row
+    song.queue_num = queue_num
+    return song
+
+
+async def get_current_song(room: models.Room, db: AsyncSession):
+    if room.current_song_id is None:
+        return None
+    song = await _get_song_with_queue_num(
+        select(models.Song).filter(models.Song.id == room.current_song_id), db
+    )
+    if song is not None:
+        song.status = models.SongState.is_playing
+    return song
+
+
+async def get_song_by_queue_num(room: models.Room, queue_num: int, db: AsyncSession):
+    song = None
+    if queue_num >= 1:
+        song = (
+            await db.execute(
+                select(models.Song)
+                .options(joinedload(models.Song.user))
+                .filter(models.Song.room == room)
+                .order_by(models.Song.position)
+                .offset(queue_num - 1)
+                .limit(1)
+            )
+        ).scalar_one_or_none()
+    if song is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"There is no song in this room playlist with index {queue_num}.",
+        )
+    song.queue_num = queue_num
+    return song
+
+
+async def get_adjacent_song(
+    room: models.Room, song: Optional[models.Song], forward: bool, db: AsyncSession
+):
+    """
+    Returns the song right after (or before) the given one, wrapping around the playlist ends.
+
+    With no song given returns the first (or the last) song of the playlist.
+    """
+    order = models.Song.position if forward else models.Song.position.desc()
+    query = (
+        select(models.Song).filter(models.Song.room == room).order_by(order).limit(1)
+    )
+    if song is not None:
+        adjacent = await _get_song_with_queue_num(
+            query.filter(
+                models.Song.position > song.position
+                if forward
+                else models.Song.position < song.position
+            ),
+            db,
+        )
+        if adjacent is not None:
+            return adjacent
+    return await _get_song_with_queue_num(query, db)
+
+
+async def get_upcoming_songs(room: models.Room, count: int, db: AsyncSession):
+    """Returns up to `count` songs queued after the current one, or the first ones if nothing plays."""
+    query = (
+        select(models.Song)
+        .filter(models.Song.room == room)
+        .order_by(models.Song.position)
+        .limit(count)
+    )
+    if room.current_song_id is not None:
+        current = (
+            select(models.Song.position)
+            .filter(models.Song.id == room.current_song_id)
+            .scalar_subquery()
+        )
+        query = query.filter(models.Song.position > current)
+    return (await db.execute(query)).scalars().all()
+
+
+async def _songs_beside(
+    room: models.Room,
+    position: Optional[int],
+    forward: bool,
+    limit: int,
+    db: AsyncSession,
+    inclusive: bool = False,
+):
+    """Returns up to `limit` songs after (or before) `position`, nearest first."""
+    column = models.Song.position
+    query = (
+        select(models.Song)
+        .options(joinedload(models.Song.user))
+        .filter(models.Song.room == room)
+        .order_by(column if forward else column.desc())
+        .limit(limit)
+    )
+    if position is not None:
+        if forward:
+            query = query.filter(column >= position if inclusive else column > position)
+        else:
+            query = query.filter(column <= position if inclusive else column < position)
+    return (await db.execute(query)).scalars().all()
+
+
+class PlaylistWindow(NamedTuple):
+    songs: list[models.Song]
+    # Positions to page from, None if there are no songs that way.
+    prev_cursor: Optional[int]
+    next_cursor: Optional[int]
+
+
+async def get_playlist_window(
+    room: models.Room,
+    before: int,
+    after: int,
+    db: AsyncSession,
+    before_cursor: Optional[int] = None,
+    after_cursor: Optional[int] = None,
+) -> PlaylistWindow:
+    """
+    Returns `before` songs before the current one, the current one and `after` songs after it.
+
+    With a cursor returns the `before` songs before it, or the `after` songs after it, instead.
+    Songs are read along the (room_id, position) index, so the cost follows the window size
+    and not the length of the playlist.
+    """
+    current = await get_current_song(room, db)
+    more_before = more_after = True
+    earlier = None  # songs before the window
+    if before_cursor is not None:
+        head = await _songs_beside(room, before_cursor, False, before + 1, db)
+        more_before = len(head) > before
+        songs = head[:before][::-1]
+    elif after_cursor is not None:
+        songs = await _songs_beside(room, after_cursor, True, after + 1, db)
+        more_after = len(songs) > after
+        songs = songs[:after]
+    else:
+        anchor = current.position if current is not None else None
+        head = (
+            await _songs_beside(room, anchor, False, before + 1, db)
+            if anchor is not None
+            else []
+        )
+        tail = await _songs_beside(room, anchor, True, after + 2, db, inclusive=True)
+        more_before, more_after = len(head) > before, len(tail) > after + 1
+        songs = head[:before][::-1] + tail[: after + 1]
+        if current is not None:
+            earlier = current.queue_num - 1 - min(len(head), before)
+    if not songs:
+        return PlaylistWindow([], None, None)
+
+    if earlier is None:
+        earlier = (
+            await db.execute(
+                select(func.count()).filter(
+                    models.Song.room == room, models.Song.position < songs[0].position
+                )
+            )
+        ).scalar_one()
+    for queue_num, song in enumerate(songs, start=earlier + 1):
+        song.queue_num = queue_num
+    set_song_states(songs, current)
+    return PlaylistWindow(
+        songs,
+        prev_cursor=songs[0].position if earlier and more_before else None,
+        next_cursor=songs[-1].position if more_after else None,
+    )
+
+
+async def get_song_history(
+    room: models.Room, limit: int, cursor: Optional[int], db: AsyncSession
+) -> tuple[list[models.PlayedSong], Optional[int]]:
+    """
+    Returns up to `limit` archived songs of the room, latest first, from before the `cursor` one.
+
+    Returns the cursor of the next page too, None on the last page.
+    """
+    query = (
+        select(models.PlayedSong)
+        .options(joinedload(models.PlayedSong.user))
+        .filter(models.PlayedSong.room_id == room.id)
+        .order_by(models.PlayedSong.seq.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        query = query.filter(models.PlayedSong.seq < cursor)
+    songs = (await db.execute(query)).scalars().all()
+    if len(songs) > limit:
+        return songs[:limit], songs[limit - 1].seq
+    return songs, None
+
+
+async def get_insert_position(
+    room: models.Room, after: Optional[int], db: AsyncSession
+) -> tuple[int, int]:
+    """
+    Picks a position for a song put after the `after`-th one (at the end if None, at the head if 0).
+
+    Returns the position and the `queue_num` the new song will have.
+    """
+    if after is None:
+        last, count = (
+            await db.execute(
+                select(func.max(models.Song.position), func.count()).filter(
+                    models.Song.room == room
+                )
+            )
+        ).one()
+        return (last or 0) + POSITION_STEP, count + 1
+    if after < 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No song found with queue index {after}",
+        )
+
+    neighbours = (
+        (
+            await db.execute(
+                select(models.Song.position)
+                .filter(models.Song.room == room)
+                .order_by(models.Song.position)
+                .offset(max(after - 1, 0))
+                .limit(2 if after else 1)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    if after == 0:
+        position = neighbours[0] - POSITION_STEP if neighbours else POSITION_STEP
+        return position, 1
+    if not neighbours:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No song found with queue index {after}",
+        )
+    if len(neighbours) == 1:
+        return neighbours[0] + POSITION_STEP, after + 1
+    low, high = neighbours
+    if high - low < 2:
+        # No room left between the neighbours: spread the playlist out again.
+        await rebalance_positions(room, db)
+        return await get_insert_position(room, after, db)
+    return (low + high) // 2, after + 1
+
+
+async def add_songs(
+    room: models.Room, user_id: int, video_ids: list[str], db: AsyncSession
+) -> list[models.Song]:
+    """
+    Appends songs in the `resolving` state to the room playlist with a single INSERT.
+
+    Returns them with `queue_num` and `status`. The caller bumps the room version and commits.
+    """
+    position, queue_num = await get_insert_position(room, None, db)
+    ids = (
+        (
+            await db.execute(
+                insert(models.Song)
+                .values(
+                    [
+                        dict(
+                            video_id=video_id,
+                            link=resolver.watch_url(video_id),
+                            avatar=resolver.thumbnail_url(video_id),
+                            position=position + i * POSITION_STEP,
+                            resolve_state=models.ResolveState.resolving,
+                            user_id=user_id,
+                            room_id=room.id,
+                        )
+                        for i, video_id in enumerate(video_ids)
+                    ]
+                )
+                .returning(models.Song.id)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    songs = (
+        (
+            await db.execute(
+                select(models.Song)
+                .options(joinedload(models.Song.user))
+                .filter(models.Song.id.in_(ids))
+                .order_by(models.Song.position)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    for queue_num, song in enumerate(songs, start=queue_num):
+        song.queue_num = queue_num
+    return set_song_states(songs, await get_current_song(room, db))
+
+
+async def rebalance_positions(room: models.Room, db: AsyncSession):
+    """Spreads positions of the room's songs evenly again, in a single UPDATE."""
+    ranked = (
+        select(
+            models.Song.id,
+            func.row_number().over(order_by=models.Song.position).label("queue_num"),
+        )
+        .filter(models.Song.room == room)
+        .subquery()
+    )
+    await db.execute(
+        update(models.Song)
+        .filter(models.Song.id == ranked.c.id)
+        .values(position=ranked.c.queue_num * POSITION_STEP)
+        .execution_options(synchronize_session="fetch")
+    )
+
+
+def place_songs(songs: list[models.Song], moved: set[models.Song]) -> bool:
+    """
+    Gives the `moved` songs positions that fit their place in `songs`, keeping the positions of the others.
+
+    The others keep their order, so the moved ones only have to fit between them.
+    Returns False, changing nothing, if there is not enough room between them.
+    """
+    placed = {}
+    low, run = None, []
+    for song in songs + [None]:
+        if song is not None and song in moved:
+            run.append(song)
+            continue
+        high = song.position if song is not None else None
+        if low is None and high is None:
+            positions = [(i + 1) * POSITION_STEP for i in range(len(run))]
+        elif low is None:
+            positions = [high - (len(run) - i) * POSITION_STEP for i in range(len(run))]
+        elif high is None:
+            positions = [low + (i + 1) * POSITION_STEP for i in range(len(run))]
+        elif high - low > len(run):
+            positions = [
+                low + (high - low) * (i + 1) // (len(run) + 1) for i in range(len(run))
+            ]
+        else:
+            return False
+        placed.update(zip(run, positions))
+        low, run = high, []
+    for song, position in placed.items():
+        song.position = position
+    return True
+
+
+class QueueChange(NamedTuple):
+    songs: list[models.Song]  # the whole playlist, with `queue_num` and `status`
+    added: list[models.Song]
+    played: Optional[models.Song]  # played by the operations, still in the playlist
+    before: list[models.Song]  # the playlist as it was loaded
+
+    def ops(self) -> list[dict]:
+        """
+        The playlist operations of /get_playlist that turn `before` into `songs`. Needs the ids, so call it after a flush.
+
+        They follow from the two playlists rather than from the operations, so songs both added and deleted leave no trace.
+        """
+        kept = set(self.songs)
+        ops = [
+            dict(op="remove", id=song.id) for song in self.before if song not in kept
+        ]
+        order = [song for song in self.before if song in kept]
+        for i, song in enumerate(self.songs):
+            if i < len(order) and order[i] is song:
+                continue
+            if song in self.added:
+                ops.append(
+                    dict(
+                        op="insert", song=jsonable_encoder(schemas.Song.from_orm(song))
+                    )
+                )
+            else:
+                order.remove(song)
+                ops.append(dict(op="move", id=song.id, queue_num=i + 1))
+            order.insert(i, song)
+        if self.played is not None:
+            ops.append(dict(op="status", id=self.played.id))
+        return ops
+
+
+async def apply_queue_ops(
+    room: models.Room,
+    user: models.User,
+    operations: list[schemas.QueueOperation],
+    db: AsyncSession,
+) -> QueueChange:
+    """
+    Applies the operations one after the other to the room playlist, loaded once.
+
+    Every `queue_num` refers to the playlist as the operations before left it.
+    Nothing is written if an operation does not fit. The caller bumps the room version and commits.
+    """
+    songs = list(await get_room_playlist(room, db))
+    current = next((s for s in songs if s.id == room.current_song_id), None)
+    before = list(songs)
+    played, moved, added = None, set(), []
+
+    def index(i: int, queue_num: Optional[int], end: int) -> int:
+        if queue_num is None or not 1 <= queue_num <= end:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Operation {i}: no song found with queue index {queue_num}",
+            )
+        return queue_num - 1
+
+    for i, operation in enumerate(operations, start=1):
+        if operation.op == "move":
+            song = songs.pop(index(i, operation.queue_num, len(songs)))
+            songs.insert(index(i, operation.to, len(songs) + 1), song)
+            moved.add(song)
+        elif operation.op == "delete":
+            song = songs.pop(index(i, operation.queue_num, len(songs)))
+            moved.discard(song)
+            if song in added:
+                added.remove(song)  # never written
+            else:
+                await db.delete(song)
+            if song is current:
+                current = None
+            if song is played:
+                played = None
+        elif operation.op == "insert":
+            try:
+                video_id = extract.video_id(operation.link or "")
+            except pytube.exceptions.RegexMatchError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Operation {i}: only YouTube links can be inserted.",
+                )
+            after = len(songs) if operation.queue_num is None else operation.queue_num
+            if after != 0:
+                index(i, after, len(songs))
+            song = models.Song(
+                user=user,
+                room_id=room.id,
+                video_id=video_id,
+                link=resolver.watch_url(video_id),
+                avatar=resolver.thumbnail_url(video_id),
+                resolve_state=models.ResolveState.resolving,
+            )
+            songs.insert(after, song)
+            moved.add(song)
+            added.append(song)
+        elif operation.op == "play":
+            song = songs[index(i, operation.queue_num, len(songs))]
+            current = played = song
+
+    if not place_songs(songs, moved):
+        # No room left between some neighbours: spread the playlist out again.
+        # The songs in the database keep their order, the moved ones are placed again.
+        await rebalance_positions(room, db)
+        positions = dict(
+            (
+                await db.execute(
+                    select(models.Song.id, models.Song.position).filter(
+                        models.Song.room == room
+                    )
+                )
+            ).all()
+        )
+        for song in songs:
+            if song.id is not None:
+                set_committed_value(song, "position", positions[song.id])
+        if not place_songs(songs, moved):
+            place_songs(songs, set(songs))
+    db.add_all(added)
+    room.current_song_id = current.id if current is not None else None
+    await db.flush()
+    if current is not None and room.current_song_id is None:
+        room.current_song_id = current.id  # added by the operations, has an id now
+    for queue_num, song in enumerate(songs, start=1):
+        song.queue_num = queue_num
+    set_song_states(songs, current)
+    return QueueChange(songs, added, played, before)
+
+
+async def set_song_metadata(
+    song_id: int, metadata: Optional[Metadata], db: AsyncSession
+):
+    """Fills in a song added in the `resolving` state, or marks it failed if `metadata` is None."""
+    if metadata is None:
+        values = dict(resolve_state=models.ResolveState.failed)
+    else:
+        values = dict(
+            title=metadata.title,
+            avatar=metadata.avatar,
+            duration=metadata.duration,
+            resolve_state=models.ResolveState.ready,
+        )
+    await db.execute(
+        update(models.Song).filter(models.Song.id == song_id).values(**values)
+    )
+
+
+def playback_position(room: models.Room, now: datetime.datetime) -> Optional[float]:
+    """
+    Seconds the current song has been playing at `now`, not counting pauses.
+
+    It is past the song `duration` once the song is over and nobody moved on yet.
+    """
+    if room.playback_started_at is None:
+        return None
+    end = room.playback_paused_at or now
+    return max((end - room.playback_started_at).total_seconds(), 0.0)
+
+
+def playback_clock(room: models.Room) -> dict:
+    """Position of the current song now, along with the time it was taken at."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return dict(position=playback_position(room, now), server_time=now)
+
+
+def playback_state(room: models.Room, song: models.Song) -> dict:
+    """**NowPlaying** fields of `song` that only change along with the room version."""
+    return dict(
+        jsonable_encoder(schemas.Song.from_orm(song)),
+        started_at=room.playback_started_at,
+        paused=room.playback_paused_at is not None,
+    )
+
+
+def now_playing(room: models.Room, song: models.Song) -> schemas.NowPlaying:
+    return schemas.NowPlaying(**playback_state(room, song), **playback_clock(room))
+
+
+def link_is_stale(song: models.Song) -> bool:
+    return song.video_id is not None and (
+        song.link_expires_at is None
+        or song.link_expires_at <= datetime.datetime.now(datetime.timezone.utc)
+    )
+
+
+async def refresh_song_link(song: models.Song) -> bool:
+    """Resolves the audio link of a song if it has none yet or it is about to expire."""
+    if not link_is_stale(song):
+        return False
+    song.link, song.link_expires_at = await resolver.resolve_stream(song.video_id)
+    return True
+
+
+async def set_playing_link(
+    room: models.Room, song: models.Song, stream: resolver.Stream, db: AsyncSession
+):
+    """
+    Writes the audio link resolved for the song just made current, and restarts its clock.
+
+    The song can't be played before it has a link, so its clock starts now, unless
+    the room has moved to another song or paused meanwhile.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await db.execute(
+        update(models.Song)
+        .filter(models.Song.id == song.id)
+        .values(link=stream.url, link_expires_at=stream.expires_at)
+    )
+    restarted = await db.execute(
+        update(models.Room)
+        .filter(
+            models.Room.id == room.id,
+            models.Room.current_song_id == song.id,
+            models.Room.playback_paused_at.is_(None),
+        )
+        .values(playback_started_at=now)
+    )
+    set_committed_value(song, "link", stream.url)
+    set_committed_value(song, "link_expires_at", stream.expires_at)
+    if restarted.rowcount:
+        set_committed_value(room, "playback_started_at", now)
+
+
+async def set_song_links(songs: list[models.Song], db: AsyncSession):
+    """Writes the audio links of songs refreshed outside of `db`."""
+    for song in songs:
+        await db.execute(
+            update(models.Song)
+            .filter(models.Song.id == song.id)
+            .values(link=song.link, link_expires_at=song.link_expires_at)
+        )
@@ -0,0 +1,153 @@
+import os
+import time
+from typing import Optional
+
+from database.redis_client import redis_client
+from models import models
+from youtube.cache import Cache
+
+PLAYLIST_CACHE_SIZE = int(os.environ.get("PLAYLIST_CACHE_SIZE", 1024))
+PLAYLIST_CACHE_TTL = int(os.environ.get("PLAYLIST_CACHE_TTL", 3600))
+
+# Song fields that follow from the order of the songs and the current song.
+_DERIVED = ("queue_num", "status")
+
+
+def _record(song: dict) -> dict:
+    return {k: v for k, v in song.items() if k not in _DERIVED}
+
+
+def _index(songs: list[dict], song_id: int) -> Optional[int]:
+    return next((i for i, song in enumerate(songs) if song["id"] == song_id), None)
+
+
+def _status(index: int, current: Optional[int]) -> models.SongState:
+    if current is None or index > current:
+        return models.SongState.in_queue
+    if index == current:
+        return models.SongState.is_playing
+    return models.SongState.played
+
+
+def _apply(entry: dict, ops: list[dict]) -> bool:
+    """Applies playlist operations to a cache entry. Returns False if they don't fit it."""
+    songs = entry["songs"]
+    for op in ops:
+        if op["op"] == "insert":
+            i = _index(songs, op["song"]["id"])
+            if i is not None:
+                del songs[i]
+            songs.insert(op["song"]["queue_num"] - 1, _record(op["song"]))
+        elif op["op"] == "remove":
+            i = _index(songs, op["id"])
+            if i is not None:
+                del songs[i]
+            if entry["current_song_id"] == op["id"]:
+                entry["current_song_id"] = None
+        elif op["op"] == "move":
+            i = _index(songs, op["id"])
+            if i is None:
+                return False
+            songs.insert(op["queue_num"] - 1, songs.pop(i))
+        elif op["op"] == "status":
+            if _index(songs, op["id"]) is None:
+                return False
+            entry["current_song_id"] = op["id"]
+        elif op["op"] == "update":
+            i = _index(songs, op["song"]["id"])
+            if i is None:
+                return False
+            songs[i].update(_record(op["song"]))
+        elif op["op"] == "user":
+            for song in songs:
+                if song["user"]["id"] == op["user"]["id"]:
+                    song["user"] = op["user"]
+    return True
+
+
+class PlaylistCache(Cache):
+    """Playlists of rooms as compact song records, stamped with the room version.
+
+    An entry is only served for the room version it was stamped with, so a
+    change the cache did not see costs a reload from the database, never a
+    stale playlist. Published changes are written through: `apply` brings the
+    entry of the previous version up to the new one. With Redis, a worker whose
+    own entry is behind picks up the one another worker wrote through.
+
+    On top of the `Cache` counters, ``stats`` count the entries found stale,
+    how many versions they were behind in total, and the changes written through.
+    """
+
+    def __init__(self, name: str, *, maxsize: int, ttl: int, client=None) -> None:
+        super().__init__(name, maxsize=maxsize, client=client)
+        self.ttl = ttl
+        self.stats.update(stale=0, stale_versions=0, updates=0)
+
+    async def _entry(self, room_id: int, version: int) -> tuple[Optional[dict], str]:
+        """Looks the entry up, in Redis too if the one in the LRU is not at `version`."""
+        entry, outcome = await self._lookup(str(room_id))
+        if entry is not None and entry["version"] != version and outcome == "hits":
+            # Changes are written through by the worker that made them, so
+            # other workers only find the newer entry in Redis.
+            remote = await self._remote(str(room_id))
+            if remote is not None and remote["version"] == version:
+                entry, outcome = remote, "redis_hits"
+        return entry, outcome
+
+    async def playlist(self, room_id: int, version: int) -> Optional[list[dict]]:
+        """Returns the songs of the room at `version`, with `queue_num` and `status`, if cached."""
+        entry, outcome = await self._entry(room_id, version)
+        self.stats[outcome] += 1
+        if entry is None:
+            return None
+        if entry["version"] != version:
+            self.stats["stale"] += 1
+            self.stats["stale_versions"] += abs(version - entry["version"])
+            return None
+        current = _index(entry["songs"], entry["current_song_id"])
+        return [
+            dict(song, queue_num=i + 1, status=_status(i, current))
+            for i, song in enumerate(entry["songs"])
+        ]
+
+    async def store(
+        self,
+        room_id: int,
+        version: int,
+        current_song_id: Optional[int],
+        songs: list[dict],
+    ) -> None:
+        entry = dict(
+            version=version,
+            current_song_id=current_song_id,
+            songs=[_record(song) for song in songs],
+        )
+        await self.set(str(room_id), entry, time.time() + self.ttl)
+
+    async def apply(self, room_id: int, version: int, ops: list[dict]) -> None:
+        """Writes the playlist operations of room `version` through to the cached playlist."""
+        entry, _ = await self._entry(room_id, version - 1)
+        if entry is None or entry["version"] != version - 1:
+            return
+        # The LRU holds the entry itself, so it is changed on a copy.
+        entry = dict(entry, songs=[dict(song) for song in entry["songs"]])
+        if not _apply(entry, ops):
+            await self.delete(str(room_id))
+            return
+        entry["version"] = version
+        await self.set(str(room_id), entry, time.time() + self.ttl)
+        self.stats["updates"] += 1
+
+    def info(self) -> dict:
+        info = super().info()
+        lookups = info["hits"] + info["redis_hits"] + info["misses"]
+        fresh = info["hits"] + info["redis_hits"] - info["stale"]
+        return dict(info, hit_rate=fresh / lookups if lookups else None)
+
+
+playlist_cache = PlaylistCache(
+    "playlists",
+    maxsize=PLAYLIST_CACHE_SIZE,
+    ttl=PLAYLIST_CACHE_TTL,
+    client=redis_client,
+)
@@ -0,0 +1,281 @@
+import asyncio
+import contextlib
+import enum
+import logging
+import os
+from collections import Counter, defaultdict, deque
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+from database.redis_client import redis_client
+from db_methods.playlist_cache import playlist_cache
+
+logger = logging.getLogger(__name__)
+
+
+class EventKind(str, enum.Enum):
+    song_added = "song_added"
+    songs_added = "songs_added"
+    song_updated = "song_updated"
+    songs_updated = "songs_updated"
+    song_deleted = "song_deleted"
+    songs_swapped = "songs_swapped"
+    queue_changed = "queue_changed"
+    links_refreshed = "links_refreshed"
+    now_playing = "now_playing"
+    user_joined = "user_joined"
+    user_updated = "user_updated"
+    user_left = "user_left"
+    room_edited = "room_edited"
+    room_deleted = "room_deleted"
+
+
+class RoomEvent(BaseModel):
+    room_id: int
+    # Room.version after the change. A client that sees a gap has missed
+    # events and should load the room state again.
+    version: int
+    kind: EventKind
+    payload: dict[str, Any] = {}
+
+
+def _offer(queue: asyncio.Queue, event: RoomEvent) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+class InMemoryBus:
+    """Delivers room events to the subscribers of this process.
+
+    Subscribers may run on other event loops than the publisher (TestClient
+    gives every request its own), so events are handed over thread-safely.
+    A subscriber that falls ``queue_size`` events behind loses the next ones
+    instead of holding the publisher up.
+    """
+
+    def __init__(self, queue_size: int = 256) -> None:
+        self._queue_size = queue_size
+        self._subscribers: dict[int, set] = defaultdict(set)
+
+    async def publish(self, event: RoomEvent) -> None:
+        for loop, queue in list(self._subscribers.get(event.room_id, ())):
+            with contextlib.suppress(RuntimeError):  # the loop is already closed
+                loop.call_soon_threadsafe(_offer, queue, event)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, room_id: int):
+        queue = asyncio.Queue(self._queue_size)
+        subscriber = (asyncio.get_running_loop(), queue)
+        self._subscribers[room_id].add(subscriber)
+
+        async def events():
+            while True:
+                yield await queue.get()
+
+        try:
+            yield events()
+        finally:
+            self._subscribers[room_id].discard(subscriber)
+            if not self._subscribers[room_id]:
+                del self._subscribers[room_id]
+
+
+class RedisBus:
+    """Delivers room events to the subscribers of every process through Redis pub/sub.
+
+    Each process keeps a single pub/sub connection, subscribed to the rooms
+    its clients listen to, and fans the messages out with an `InMemoryBus`.
+    """
+
+    def __init__(self, client, *, prefix: str = "room_events:") -> None:
+        self._client = client
+        self._prefix = prefix
+        self._local = InMemoryBus()
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._rooms: Counter = Counter()
+
+    def _channel(self, room_id: int) -> str:
+        return f"{self._prefix}{room_id}"
+
+    async def publish(self, event: RoomEvent) -> None:
+        await self._client.publish(self._channel(event.room_id), event.json())
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+                if message is not None:
+                    await self._local.publish(RoomEvent.parse_raw(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Room event listener failed")
+                await asyncio.sleep(1)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, room_id: int):
+        async with self._local.subscribe(room_id) as events:
+            if self._pubsub is None:
+                self._pubsub = self._client.pubsub()
+            self._rooms[room_id] += 1
+            if self._rooms[room_id] == 1:
+                await self._pubsub.subscribe(self._channel(room_id))
+            if self._listener is None or self._listener.done():
+                self._listener = asyncio.ensure_future(self._listen())
+            try:
+                yield events
+            finally:
+                self._rooms[room_id] -= 1
+                if not self._rooms[room_id]:
+                    del self._rooms[room_id]
+                    await self._pubsub.unsubscribe(self._channel(room_id))
+
+
+def _contiguous(events: list[RoomEvent], since: int, until: int) -> bool:
+    return [event.version for event in events] == list(range(since + 1, until + 1))
+
+
+class InMemoryChangeLog:
+    """Keeps the last ``size`` events of every room of this process."""
+
+    def __init__(self, size: int) -> None:
+        self._events: dict[int, deque] = defaultdict(lambda: deque(maxlen=size))
+
+    async def append(self, event: RoomEvent) -> None:
+        self._events[event.room_id].append(event)
+
+    async def since(
+        self, room_id: int, since: int, until: int
+    ) -> Optional[list[RoomEvent]]:
+        """
+        Returns the events of the room after version `since`, up to version `until`.
+
+        Returns None if some of them are no longer, or not yet, in the log.
+        """
+        events = sorted(
+            (e for e in self._events.get(room_id, ()) if since < e.version <= until),
+            key=lambda e: e.version,
+        )
+        return events if _contiguous(events, since, until) else None
+
+
+class RedisChangeLog:
+    """Keeps the last ``size`` events of every room in a Redis list, shared by all processes.
+
+    The log of a room expires after ``ttl`` seconds without changes.
+    """
+
+    def __init__(
+        self, client, size: int, *, ttl: int = 24 * 3600, prefix: str = "room_log:"
+    ) -> None:
+        self._client = client
+        self._size = size
+        self._ttl = ttl
+        self._prefix = prefix
+
+    def _key(self, room_id: int) -> str:
+        return f"{self._prefix}{room_id}"
+
+    async def append(self, event: RoomEvent) -> None:
+        key = self._key(event.room_id)
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.lpush(key, event.json())
+            pipe.ltrim(key, 0, self._size - 1)
+            pipe.expire(key, self._ttl)
+            await pipe.execute()
+
+    async def since(
+        self, room_id: int, since: int, until: int
+    ) -> Optional[list[RoomEvent]]:
+        # Processes publish concurrently, so the list is only roughly in version order.
+        messages = await self._client.lrange(self._key(room_id), 0, -1)
+        events = sorted(
+            (
+                event
+                for event in map(RoomEvent.parse_raw, messages)
+                if since < event.version <= until
+            ),
+            key=lambda e: e.version,
+        )
+        return events if _contiguous(events, since, until) else None
+
+
+def playlist_ops(event: RoomEvent) -> list[dict]:
+    """Translates a room event into the playlist operations a client has to apply."""
+    payload, version = event.payload, event.version
+    if event.kind == EventKind.song_added:
+        return [dict(version=version, op="insert", song=payload)]
+    if event.kind == EventKind.songs_added:
+        return [
+            dict(version=version, op="insert", song=song) for song in payload["songs"]
+        ]
+    if event.kind == EventKind.song_deleted:
+        return [dict(version=version, op="remove", id=payload["id"])]
+    if event.kind == EventKind.songs_swapped:
+        # Moving the lower song down first leaves the higher one right above it.
+        return [
+            dict(
+                version=version,
+                op="move",
+                id=payload["id1"],
+                queue_num=payload["queue_num2"],
+            ),
+            dict(
+                version=version,
+                op="move",
+                id=payload["id2"],
+                queue_num=payload["queue_num1"],
+            ),
+        ]
+    if event.kind == EventKind.queue_changed:
+        return [dict(op, version=version) for op in payload["ops"]]
+    if event.kind == EventKind.now_playing:
+        return [dict(version=version, op="status", id=payload["id"])]
+    if event.kind == EventKind.song_updated:
+        return [dict(version=version, op="update", song=payload)]
+    if event.kind in (EventKind.songs_updated, EventKind.links_refreshed):
+        return [
+            dict(version=version, op="update", song=song) for song in payload["songs"]
+        ]
+    if event.kind == EventKind.user_updated:
+        return [dict(version=version, op="user", user=payload)]
+    return []
+
+
+# How many events of each room are kept for clients catching up.
+ROOM_LOG_SIZE = int(os.environ.get("ROOM_LOG_SIZE", 256))
+
+# Without REDIS_URL events only reach clients of this process, which is only
+# fit for a single worker and for tests.
+if redis_client is not None:
+    bus = RedisBus(redis_client)
+    changelog = RedisChangeLog(redis_client, ROOM_LOG_SIZE)
+else:
+    bus = InMemoryBus()
+    changelog = InMemoryChangeLog(ROOM_LOG_SIZE)
+
+
+async def publish(
+    room_id: int, version: int, kind: EventKind, payload: Optional[dict] = None
+):
+    """Tells the room subscribers about a change. Call it once the change is committed."""
+    event = RoomEvent(
+        room_id=room_id, version=version, kind=kind, payload=payload or {}
+    )
+    try:
+        await changelog.append(event)
+    except Exception:
+        # Clients asking for the missed changes get a full snapshot instead.
+        logger.exception("Could not log room event")
+    try:
+        await playlist_cache.apply(room_id, version, playlist_ops(event))
+    except Exception:
+        # Readers reload the playlist once they find the cached one stale.
+        logger.exception("Could not update cached playlist")
+    await bus.publish(event)
@@ -4,8 +4,12 @@ import datetime
 import aiofiles
 from fastapi import UploadFile, HTTPException
 
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.orm import aliased
+
 import models.models
 from database.db import SessionLocal
+from youtube import resolver
 
 
 async def save_file(file: UploadFile, out_path: str, max_size=15):
@@ -50,3 +54,192 @@ def delete_images_not_in_db():
             ):
                 os.remove(os.getcwd() + "/images/" + i)
     return
+
+
+# How many refreshed links are written per transaction.
+REFRESH_CHUNK = 10
+
+
+def refresh_expiring_links(window=1800, limit=100):
+    """
+    Resolves again the audio links of queued songs that expire within `window` seconds.
+
+    YouTube is asked with no transaction open, and the links are written in
+    small chunks, so a song deleted meanwhile only loses its own link.
+    Returns how many links were written.
+    """
+    Song, Room = models.models.Song, models.models.Room
+    current = aliased(Song)
+    db = SessionLocal()
+    try:
+        songs = (
+            db.query(Song.id, Song.video_id, Song.room_id)
+            .join(Room, Room.id == Song.room_id)
+            .outerjoin(current, current.id == Room.current_song_id)
+            .filter(
+                Song.video_id.isnot(None),
+                # Songs that were never resolved are resolved when played.
+                Song.link_expires_at
+                < datetime.datetime.now(datetime.timezone.utc)
+                + datetime.timedelta(seconds=window),
+                or_(current.id.is_(None), Song.position >= current.position),
+            )
+            .order_by(Song.link_expires_at)
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+
+    refreshed = 0
+    for start in range(0, len(songs), REFRESH_CHUNK):
+        links = []
+        for song_id, video_id, room_id in songs[start : start + REFRESH_CHUNK]:
+            try:
+                stream_url = resolver.fetch_stream_url(video_id)
+            except Exception:
+                continue
+            links.append((song_id, room_id, resolver.make_stream(stream_url)))
+        if not links:
+            continue
+        db = SessionLocal()
+        try:
+            rooms = set()
+            for song_id, room_id, (link, expires_at) in links:
+                # A plain UPDATE, so a song deleted meanwhile is just skipped.
+                updated = db.execute(
+                    update(Song)
+                    .where(Song.id == song_id)
+                    .values(link=link, link_expires_at=expires_at)
+                ).rowcount
+                if updated:
+                    rooms.add(room_id)
+                    refreshed += 1
+            # New links change the playlists, so their cached copies are stale now.
+            db.query(Room).filter(Room.id.in_(rooms)).update(
+                {Room.version: Room.version + 1}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+    return refreshed
+
+
+# Played songs stay in the live playlist until this many played songs follow
+# them, or until this long after they were played.
+ARCHIVE_KEEP_PLAYED = int(os.environ.get("ARCHIVE_KEEP_PLAYED", 50))
+ARCHIVE_AFTER = int(os.environ.get("ARCHIVE_AFTER_MINUTES", 120)) * 60
+
+
+def _songs_to_archive(db, keep, cutoff, batch, rooms=None):
+    Song, Room = models.models.Song, models.models.Room
+    current = aliased(Song)
+    played = (
+        select(
+            Song.id,
+            # 1 for the song right before the current one, 2 for the one before it...
+            func.row_number()
+            .over(partition_by=Song.room_id, order_by=Song.position.desc())
+            .label("back"),
+            # Skipped songs count as played when the current song started.
+            func.coalesce(Song.played_at, Room.playback_started_at).label("played_at"),
+        )
+        .join(Room, Room.id == Song.room_id)
+        .join(current, current.id == Room.current_song_id)
+        .filter(Song.position < current.position)
+    )
+    if rooms is not None:
+        played = played.filter(Song.room_id.in_(rooms))
+    played = played.subquery()
+    return (
+        db.execute(
+            select(played.c.id)
+            .filter(or_(played.c.back > keep, played.c.played_at < cutoff))
+            # Earlier songs go first, so they get the lower PlayedSong.seq.
+            .order_by(played.c.back.desc())
+            .limit(batch)
+        )
+        .scalars()
+        .all()
+    )
+
+
+def archive_played_songs(keep=None, older_than=None, batch=1000):
+    """
+    Moves played songs out of `songs` into `song_history`, `batch` songs per transaction.
+
+    A played song goes once more than `keep` played songs follow it, or once it was played more than `older_than` seconds ago.
+    Returns how many songs were moved.
+    """
+    Song, Room, PlayedSong = (
+        models.models.Song,
+        models.models.Room,
+        models.models.PlayedSong,
+    )
+    keep = ARCHIVE_KEEP_PLAYED if keep is None else keep
+    older_than = ARCHIVE_AFTER if older_than is None else older_than
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cutoff = now - datetime.timedelta(seconds=older_than)
+    archived = 0
+    while True:
+        db = SessionLocal()
+        try:
+            candidates = _songs_to_archive(db, keep, cutoff, batch)
+            if not candidates:
+                return archived
+            # Locked like the API does before changing a playlist, then
+            # picked again, as the current songs may have moved meanwhile.
+            rooms = {
+                room_id
+                for (room_id,) in db.query(Song.room_id).filter(Song.id.in_(candidates))
+            }
+            locked = db.query(Room.id).filter(Room.id.in_(rooms)).order_by(Room.id)
+            locked.with_for_update().all()
+            ids = _songs_to_archive(db, keep, cutoff, batch, rooms)
+            songs = (
+                db.query(Song)
+                .filter(Song.id.in_(ids))
+                .order_by(Song.room_id, Song.position)
+                .all()
+            )
+            # The rooms are locked, so nothing else archives their songs meanwhile.
+            seq = dict(
+                db.query(PlayedSong.room_id, func.max(PlayedSong.seq))
+                .filter(PlayedSong.room_id.in_(rooms))
+                .group_by(PlayedSong.room_id)
+                .all()
+            )
+            records = []
+            for song in songs:
+                seq[song.room_id] = seq.get(song.room_id, 0) + 1
+                records.append(
+                    dict(
+                        id=song.id,
+                        seq=seq[song.room_id],
+                        video_id=song.video_id,
+                        link=song.link,
+                        position=song.position,
+                        title=song.title,
+                        avatar=song.avatar,
+                        duration=song.duration,
+                        played_at=song.played_at,
+                        archived_at=now,
+                        user_id=song.user_id,
+                        room_id=song.room_id,
+                    )
+                )
+            if songs:
+                db.execute(insert(PlayedSong), records)
+                db.query(Song).filter(Song.id.in_(ids)).delete(
+                    synchronize_session=False
+                )
+                # Queue numbers of the songs left changed.
+                db.query(Room).filter(Room.id.in_(rooms)).update(
+                    {Room.version: Room.version + 1}, synchronize_session=False
+                )
+            db.commit()
+            archived += len(songs)
+            if len(candidates) < batch:
+                return archived
+        finally:
+            db.close()
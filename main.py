@@ -1,19 +1,23 @@
 from celery.result import AsyncResult
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.params import Body
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 from starlette.responses import JSONResponse
 
 from worker import create_task
 
 from database.db import engine
+from database.tasks import task_store
 from models import models
-from routes import routes, room_routes, song_routes, user_routes
+from routes import event_routes, routes, room_routes, song_routes, user_routes
+from youtube.cache import caches
 
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="KwaDrop Backend API")
+app = FastAPI(title="KwaDrop Backend API", default_response_class=ORJSONResponse)
 
 origins = [
     "http://localhost:8021",
@@ -30,13 +34,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["set-cookie", "Set-Cookie"],
+    expose_headers=["set-cookie", "Set-Cookie", "ETag"],
 )
 
 app.include_router(routes.router)
 app.include_router(user_routes.router)
 app.include_router(room_routes.router)
 app.include_router(song_routes.router)
+app.include_router(event_routes.router)
 
 
 @app.get("/")
@@ -44,6 +49,12 @@ async def home():
     return {"message": "Hello World"}
 
 
+@app.get("/cache_stats")
+async def cache_stats():
+    """Hit and miss counters of the in-process caches of this worker."""
+    return {name: cache.info() for name, cache in caches.items()}
+
+
 @app.post("/tasks", status_code=201)
 def run_task(payload=Body(...)):
     task_types = [0]
@@ -57,12 +68,19 @@ def run_task(payload=Body(...)):
     return JSONResponse({"task_id": task.id})
 
 
-@app.get("/tasks/{task_id}")
-def get_status(task_id):
+def celery_status(task_id):
     task_result = AsyncResult(task_id)
-    result = {
+    return {
         "task_id": task_id,
         "task_status": task_result.status,
         "task_result": task_result.result,
     }
+
+
+@app.get("/tasks/{task_id}")
+async def get_status(task_id):
+    # Jobs run by the API itself, like song imports, are not Celery tasks.
+    result = await task_store.get(task_id)
+    if result is None:
+        result = await run_in_threadpool(celery_status, task_id)
     return JSONResponse(result)
@@ -1,6 +1,6 @@
 import enum
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum
+from sqlalchemy import Column, DateTime, Integer, String, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 
 from database.db import Base
@@ -19,6 +19,12 @@ class SongState(enum.IntEnum):
     played = 2
 
 
+class ResolveState(enum.IntEnum):
+    ready = 0
+    resolving = 1
+    failed = 2
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -36,6 +42,22 @@ class Room(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     password = Column(String)
+    # Bumped by every change of the room, its playlist or its users,
+    # see db_methods.bump_room_version.
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    current_song_id = Column(
+        ForeignKey(
+            "songs.id",
+            name="rooms_current_song_id_fkey",
+            use_alter=True,
+            ondelete="SET NULL",
+        ),
+        nullable=True,
+    )
+    # Playback clock of the current song: when it would have started had it
+    # never been paused, and when it was paused, see db_methods.playback_position.
+    playback_started_at = Column(DateTime(timezone=True))
+    playback_paused_at = Column(DateTime(timezone=True))
 
     associations = relationship("Association", back_populates="room")
 
@@ -53,15 +75,60 @@ class Association(Base):
 
 class Song(Base):
     __tablename__ = "songs"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    __table_args__ = (
+        Index("ix_songs_room_id_position", "room_id", "position"),
+        Index("ix_songs_link_expires_at", "link_expires_at"),
+    )
+
+    # `status` and `queue_num` are not stored: they are derived from
+    # Room.current_song_id and the song order, see db_methods.
+    id = Column(Integer, primary_key=True, autoincrement=True, unique=True)
+    video_id = Column(String)
+    # Audio links expire, so they are resolved from `video_id` when the song is
+    # about to be played, see db_methods.refresh_song_link.
     link = Column(String, nullable=False)
-    status = Column(Enum(SongState), default=SongState.in_queue)
-    queue_num = Column(Integer, nullable=False)
+    link_expires_at = Column(DateTime(timezone=True))
+    position = Column(Integer, nullable=False)
     title = Column(String)
     avatar = Column(String)
+    duration = Column(Integer)  # seconds
+    # When the song last started playing, see helpers.archive_played_songs.
+    played_at = Column(DateTime(timezone=True))
+    # Title and audio stream are fetched from YouTube after the song is added.
+    resolve_state = Column(
+        Enum(ResolveState),
+        nullable=False,
+        default=ResolveState.ready,
+        server_default=ResolveState.ready.name,
+    )
     user_id = Column(ForeignKey("users.id"), primary_key=True)
     room_id = Column(ForeignKey("rooms.id"), primary_key=True)
 
     user = relationship("User")
-    room = relationship("Room")
+    room = relationship("Room", foreign_keys=[room_id])
+
+
+class PlayedSong(Base):
+    """A song moved out of `songs` some time after it was played, see helpers.archive_played_songs."""
+
+    __tablename__ = "song_history"
+    __table_args__ = (
+        Index("ix_song_history_room_id_seq", "room_id", "seq", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)  # the id it had in `songs`
+    # Counts the songs archived in the room, in playlist order. Unlike `position`,
+    # which is renumbered, it only grows, so the history is ordered by it.
+    seq = Column(Integer, nullable=False)
+    video_id = Column(String)
+    link = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+    title = Column(String)
+    avatar = Column(String)
+    duration = Column(Integer)
+    played_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), nullable=False)
+    user_id = Column(ForeignKey("users.id", ondelete="SET NULL"))
+    room_id = Column(ForeignKey("rooms.id", ondelete="CASCADE"), nullable=False)
+
+    user = relationship("User")
@@ -1,6 +1,7 @@
-from typing import Optional
+import datetime
+from typing import Any, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
 
 import models.models
 
@@ -29,24 +30,113 @@ class Room(BaseModel):
 
 class Song(BaseModel):
     id: int
+    video_id: Optional[str]
     link: str
     queue_num: int
-    title: str
+    title: Optional[str]
     avatar: Optional[str]
+    duration: Optional[int]
     status: models.models.SongState
+    resolve_state: models.models.ResolveState
     user: User
 
     class Config:
         orm_mode = True
 
 
+class NowPlaying(Song):
+    # When the song would have started had it never been paused.
+    started_at: Optional[datetime.datetime]
+    paused: bool
+    # Seconds into the song at `server_time`.
+    position: Optional[float]
+    server_time: datetime.datetime
+
+
+class SongImport(BaseModel):
+    playlist: Optional[str]
+    links: list[str] = []
+
+
+class Task(BaseModel):
+    task_id: str
+
+
+class QueueOperation(BaseModel):
+    op: Literal["move", "delete", "insert", "play"]
+    # The song moved, deleted or played, or the one an inserted song goes after.
+    queue_num: Optional[int]
+    to: Optional[int]  # where a moved song goes
+    link: Optional[str]  # YouTube link of an inserted song
+
+    @root_validator(skip_on_failure=True)
+    def check_fields(cls, values):
+        required = dict(
+            move=("queue_num", "to"),
+            delete=("queue_num",),
+            insert=("link",),
+            play=("queue_num",),
+        )[values["op"]]
+        missing = [field for field in required if values.get(field) is None]
+        if missing:
+            raise ValueError(f"{values['op']} needs {' and '.join(missing)}")
+        return values
+
+
+class SearchResult(BaseModel):
+    link: str
+    title: str
+    img: str
+
+
 class Playlist(BaseModel):
     songs: list[Song]
+    version: Optional[int]
 
     class Config:
         orm_mode = True
 
 
+class PlaylistWindow(BaseModel):
+    songs: list[Song]
+    version: int
+    prev_cursor: Optional[int]
+    next_cursor: Optional[int]
+
+
+class PlayedSong(BaseModel):
+    id: int
+    video_id: Optional[str]
+    link: str
+    title: Optional[str]
+    avatar: Optional[str]
+    duration: Optional[int]
+    played_at: Optional[datetime.datetime]
+    user: Optional[User]
+
+    class Config:
+        orm_mode = True
+
+
+class SongHistory(BaseModel):
+    songs: list[PlayedSong]
+    next_cursor: Optional[int]
+
+
+class PlaylistOp(BaseModel):
+    version: int
+    op: str
+    id: Optional[int]
+    queue_num: Optional[int]
+    song: Optional[dict[str, Any]]
+    user: Optional[dict[str, Any]]
+
+
+class PlaylistDelta(BaseModel):
+    version: int
+    ops: list[PlaylistOp]
+
+
 class UserList(BaseModel):
     users: list["RoomAssociation"]
 
@@ -0,0 +1,129 @@
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi_sessions.frontends.session_frontend import FrontendError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import HTTPConnection
+
+from FastApi_sessions.fastapi_session import SessionData, backend, cookie, verifier
+from database.db import AsyncSessionLocal, get_db
+from db_methods.db_methods import Membership, get_membership, lock_room
+from models import models
+from youtube.cache import Cache
+
+
+async def current_membership(
+    request: Request,
+    session_data: SessionData = Depends(verifier),
+    db: AsyncSession = Depends(get_db),
+) -> Membership:
+    """
+    Resolves *current* **User** with its **Room** association.
+
+    The result is kept on the request, so it is loaded at most once per request.
+    """
+    membership = getattr(request.state, "membership", None)
+    if membership is None:
+        membership = await get_membership(session_data.session_id, db)
+        request.state.membership = membership
+    return membership
+
+
+async def room_membership(
+    membership: Membership = Depends(current_membership),
+) -> Membership:
+    """
+    Same as `current_membership`, but requires **User** to be connected to a **Room**.
+    """
+    if membership.room is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="This user has no association with any room.",
+        )
+    return membership
+
+
+async def locked_room_membership(
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
+) -> Membership:
+    """
+    Same as `room_membership`, but holds a lock on the **Room** until the request commits.
+
+    Use it for changes of the playlist, so that concurrent ones don't overwrite each other.
+    """
+    await lock_room(membership.room, db)
+    return membership
+
+
+async def stream_membership(connection: HTTPConnection) -> Optional[Membership]:
+    """
+    Same as `current_membership`, for WebSockets and event streams. Returns None if the session is invalid.
+
+    The database session is closed right away, so a long-lived stream doesn't hold a connection.
+    """
+    session_id = cookie(connection)
+    if isinstance(session_id, FrontendError):
+        return None
+    session_data = await backend.read(session_id)
+    if session_data is None:
+        return None
+    async with AsyncSessionLocal() as db:
+        try:
+            return await get_membership(session_data.session_id, db)
+        except HTTPException:
+            return None
+
+
+def room_etag(room: models.Room) -> str:
+    """Every change of a room bumps its version, so the version tags all room reads."""
+    return f'"{room.id}-{room.version}"'
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Returns a `304 Not Modified` response if the client already has `etag`.
+
+    Otherwise puts `etag` on `response` and returns None.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+# Bodies of hot read responses, encoded once per room version.
+encoded_responses = Cache(
+    "encoded_responses", maxsize=int(os.environ.get("ENCODED_RESPONSES_SIZE", 512))
+)
+ENCODED_RESPONSE_TTL = 3600
+
+
+async def encoded_json(
+    key: str,
+    response: Response,
+    load: Callable[[], Awaitable[Any]],
+    extra: Optional[dict] = None,
+) -> Response:
+    """
+    Returns the JSON of what `load` returns, encoded once per `key`, with the headers of `response`.
+
+    Put the room version in `key`, so that a change of the room encodes a new body.
+    Fields that change more often go in `extra`, which is encoded on every call.
+    The body is not validated against the `response_model` again.
+    """
+    body = await encoded_responses.get(key)
+    if body is None:
+        body = orjson.dumps(await load())
+        await encoded_responses.set(key, body, time.time() + ENCODED_RESPONSE_TTL)
+    if extra:
+        # The body is a JSON object, so the extra fields go before its closing brace.
+        body = body[:-1] + b"," + orjson.dumps(extra)[1:]
+    return Response(body, media_type="application/json", headers=dict(response.headers))
@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+import os
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.params import Header
+from fastapi.responses import StreamingResponse
+
+from FastApi_sessions.fastapi_session import cookie
+from database.db import AsyncSessionLocal
+from db_methods.db_methods import get_current_song, now_playing
+from events.bus import EventKind, RoomEvent, bus
+from models import models
+from routes.dependencies import stream_membership
+
+router = APIRouter()
+
+# Seconds between keep-alive comments, so that proxies don't drop an idle stream.
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", 15))
+
+
+def _ends_stream(event: RoomEvent, user_id: int) -> bool:
+    return event.kind == EventKind.room_deleted or (
+        event.kind == EventKind.user_left and event.payload["user_id"] == user_id
+    )
+
+
+async def _forward_events(websocket: WebSocket, events, user_id: int):
+    async for event in events:
+        await websocket.send_text(event.json())
+        if _ends_stream(event, user_id):
+            await websocket.close()
+            return
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@router.websocket("/ws/room")
+async def room_socket(websocket: WebSocket):
+    """
+    Pushes changes of *current* **Room** as JSON messages: `{"room_id", "version", "kind", "payload"}`.
+
+    The socket is authenticated with the session cookie and is closed once the **User** leaves the room.
+    """
+    membership = await stream_membership(websocket)
+    if membership is None or membership.room is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    async with bus.subscribe(membership.room.id) as events:
+        tasks = {
+            asyncio.ensure_future(
+                _forward_events(websocket, events, membership.user.id)
+            ),
+            asyncio.ensure_future(_wait_for_disconnect(websocket)),
+        }
+        _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _now_playing_event(version: int, song: Optional[dict]) -> str:
+    data = orjson.dumps(song).decode()
+    return f"id: {version}\nevent: now_playing\ndata: {data}\n\n"
+
+
+async def _load_now_playing(room_id: int):
+    async with AsyncSessionLocal() as db:
+        room = await db.get(models.Room, room_id)
+        if room is None:
+            return None, None
+        song = await get_current_song(room, db)
+    if song is not None:
+        song = jsonable_encoder(now_playing(room, song))
+    return room.version, song
+
+
+async def _now_playing_stream(room_id: int, user_id: int, last_event_id: Optional[int]):
+    async with bus.subscribe(room_id) as events:
+        # Subscribed first, so no change between the snapshot and the events is lost.
+        version, song = await _load_now_playing(room_id)
+        if version is None:
+            return
+        if last_event_id != version:
+            yield _now_playing_event(version, song)
+        current_id = song and song["id"]
+
+        next_event = asyncio.ensure_future(events.__anext__())
+        try:
+            while True:
+                done, _ = await asyncio.wait({next_event}, timeout=SSE_HEARTBEAT)
+                if not done:
+                    yield ": heartbeat\n\n"
+                    continue
+                event = next_event.result()
+                next_event = asyncio.ensure_future(events.__anext__())
+                if event.version <= version:
+                    continue
+                if event.kind == EventKind.now_playing:
+                    current_id = event.payload["id"]
+                    yield _now_playing_event(event.version, event.payload)
+                elif (
+                    event.kind == EventKind.queue_changed
+                    and "now_playing" in event.payload
+                ):
+                    song = event.payload["now_playing"]
+                    current_id = song and song["id"]
+                    yield _now_playing_event(event.version, song)
+                elif (
+                    event.kind == EventKind.song_deleted
+                    and event.payload["id"] == current_id
+                ):
+                    current_id = None
+                    yield _now_playing_event(event.version, None)
+                elif _ends_stream(event, user_id):
+                    return
+        finally:
+            next_event.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                await next_event
+
+
+@router.get(
+    "/events/now_playing",
+    dependencies=[Depends(cookie)],
+    response_class=StreamingResponse,
+    tags=["Songs"],
+)
+async def now_playing_events(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Streams the currently playing **Song** of *current* **Room** as Server-Sent Events, each time it changes.
+
+    Each `now_playing` event holds a **Song** object with its playback clock, or `null` once the playing song is deleted.
+    Pausing and resuming the song send a new event as well.
+    Its id is the room version: a client reconnecting with *Last-Event-ID* gets the current song again only if the room changed meanwhile.
+
+        Use it instead of polling /get_current_song when WebSockets are not available.
+    """
+    membership = await stream_membership(request)
+    if membership is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid session"
+        )
+    if membership.room is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="This user has no association with any room.",
+        )
+    try:
+        last_version = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        last_version = None
+    return StreamingResponse(
+        _now_playing_stream(membership.room.id, membership.user.id, last_version),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,17 +1,28 @@
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.params import Query
+from sqlalchemy import select
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from FastApi_sessions.fastapi_session import SessionData, cookie, verifier
+from FastApi_sessions.fastapi_session import cookie
 from database.db import get_db
 from db_methods.db_methods import (
-    get_user_by_session,
+    Membership,
+    bump_room_version,
     create_room as db_create_room,
 )
+from events.bus import EventKind, publish
 from models import models, schemas
+from routes.dependencies import (
+    current_membership,
+    not_modified,
+    room_etag,
+    room_membership,
+)
 
 
 router = APIRouter()
@@ -26,8 +37,8 @@ router = APIRouter()
 async def create_room(
     name: str = Query(..., description="""Name of the room"""),
     password: Optional[str] = Query(None, description="""Password of the room."""),
-    session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(current_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Creates a **Room** for *current* user. User automatically connects to this room and becomes an administrator.
@@ -37,20 +48,12 @@ async def create_room(
         Note that user can belong to only one room.
     """
     try:
-        user = get_user_by_session(session_data.session_id, db)
-        try:
-            a = (
-                db.query(models.Association)
-                .filter(models.Association.user == user)
-                .one()
-            )
+        if membership.association is not None:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="User already has association to existing room.",
             )
-        except NoResultFound:
-            pass
-        room = db_create_room(name, password, user, db)
+        room = await db_create_room(name, password, membership.user, db)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -65,26 +68,36 @@ async def create_room(
     tags=["Room"],
 )
 async def get_roommates(
-    session_data: SessionData = Depends((verifier)), db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Returns a list of **User** objects who are connected to *current* **Room**.
 
+    Answers *304 Not Modified* if the room has not changed since the *ETag* given in *If-None-Match*.
+
         Note that API understands automatically which room is current user connected to.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a: models.Association = (
-            db.query(models.Association).filter(models.Association.user == user).one()
-        )
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
+        room = membership.room
+        cached = not_modified(request, response, room_etag(room))
+        if cached is not None:
+            return cached
         a_list = (
-            db.query(models.Association).filter(models.Association.room == room).all()
-        )
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
+            (
+                await db.execute(
+                    select(models.Association)
+                    .options(
+                        joinedload(models.Association.user),
+                        joinedload(models.Association.room),
+                    )
+                    .filter(models.Association.room == room)
+                )
+            )
+            .scalars()
+            .all()
         )
     except HTTPException as e:
         raise e
@@ -102,8 +115,8 @@ async def get_roommates(
 async def edit_room(
     name: Optional[str] = Query(None, description="""New name"""),
     password: Optional[str] = Query(None, description="""New password"""),
-    session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Edits **Room's** settings if **User** has a permission to do this action.
@@ -115,25 +128,23 @@ async def edit_room(
         Note that API understands automatically which room is current user connected to.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a: models.Association = (
-            db.query(models.Association).filter(models.Association.user == user).one()
-        )
+        room = membership.room
         # if a.usertype not in (models.UserType.host, models.UserType.moder):  todo: Илья исправить должен чет на фронте
         #     raise HTTPException(
         #         status_code=status.HTTP_403_FORBIDDEN,
         #         detail="This user has no permission to edit this room.",
         #     )
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
         if name is not None:
             setattr(room, "name", name)
         if password is not None:
             setattr(room, "password", password)
-        db.commit()
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
+        version = await bump_room_version(room, db)
+        await db.commit()
+        await publish(
+            room.id,
+            version,
+            EventKind.room_edited,
+            jsonable_encoder(schemas.Room.from_orm(room)),
         )
     except HTTPException as e:
         raise e
@@ -149,7 +160,8 @@ async def edit_room(
     tags=["Room"],
 )
 async def delete_room(
-    session_data: SessionData = Depends(verifier), db: Session = Depends(get_db)
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Deletes a **Room** if **User** has a permission to do this action. Automatically disconnects all users from this room.
@@ -159,29 +171,27 @@ async def delete_room(
         Note that API understands automatically which room is current user connected to.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a: models.Association = (
-            db.query(models.Association).filter(models.Association.user == user).one()
-        )
+        a, room = membership.association, membership.room
         if a.usertype not in (models.UserType.host, models.UserType.moder):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="This user has no permission to edit this room.",
             )
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
         a_list = (
-            db.query(models.Association).filter(models.Association.room == room).all()
+            (
+                await db.execute(
+                    select(models.Association).filter(models.Association.room == room)
+                )
+            )
+            .scalars()
+            .all()
         )
         for i in a_list:
-            db.delete(i)
-        db.flush()
-        db.delete(room)
-        db.commit()
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
-        )
+            await db.delete(i)
+        version = await bump_room_version(room, db)
+        await db.delete(room)
+        await db.commit()
+        await publish(room.id, version, EventKind.room_deleted)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -198,8 +208,8 @@ async def delete_room(
 async def connect(
     room_id: int = Query(..., description="""Room id."""),
     password: Optional[str] = Query(None, description="""Room password"""),
-    session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(current_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Connects **User** to **Room**.
@@ -207,29 +217,32 @@ async def connect(
     Returns a **Room** object.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        try:
-            a = (
-                db.query(models.Association)
-                .filter(models.Association.user == user)
-                .one()
-            )
+        if membership.association is not None:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="User already has association to existing room.",
             )
-        except NoResultFound:
-            pass
-        room = db.query(models.Room).filter(models.Room.id == room_id).one()
+        room = (
+            await db.execute(select(models.Room).filter(models.Room.id == room_id))
+        ).scalar_one()
         if room.password is not None:
             if password != room.password:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Password is incorrect",
                 )
-        a = models.Association(user=user, room=room, usertype=models.UserType.basic)
+        a = models.Association(
+            user=membership.user, room=room, usertype=models.UserType.basic
+        )
         db.add(a)
-        db.commit()
+        version = await bump_room_version(room, db)
+        await db.commit()
+        await publish(
+            room.id,
+            version,
+            EventKind.user_joined,
+            jsonable_encoder(schemas.RoomAssociation.from_orm(a)),
+        )
     except NoResultFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -244,7 +257,8 @@ async def connect(
 
 @router.delete("/disconnect", dependencies=[Depends(cookie)], tags=["Room"])
 async def disconnect(
-    session_data: SessionData = Depends(verifier), db: Session = Depends(get_db)
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Disconnects **User** from a **Room**.
@@ -252,14 +266,14 @@ async def disconnect(
         Note that API understands automatically which room is current user connected to.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        db.delete(a)
-        db.commit()
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
+        await db.delete(membership.association)
+        version = await bump_room_version(membership.room, db)
+        await db.commit()
+        await publish(
+            membership.room.id,
+            version,
+            EventKind.user_left,
+            dict(user_id=membership.user.id),
         )
     except HTTPException as e:
         raise e
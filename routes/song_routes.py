@@ -1,22 +1,305 @@
+import asyncio
+import datetime
 import json
-from typing import Optional
+import logging
+import os
+from typing import Optional, Union
 
 import pytube.exceptions
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Body,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
+from fastapi.encoders import jsonable_encoder
 from fastapi.params import Query
-from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from FastApi_sessions.fastapi_session import SessionData, cookie, verifier
-from database.db import get_db
+from FastApi_sessions.fastapi_session import cookie
+from database.db import AsyncSessionLocal, get_db
 from db_methods.db_methods import (
-    get_user_by_session,
-    get_room_playlist,
+    Membership,
+    add_songs,
+    apply_queue_ops,
+    bump_room_version,
+    get_adjacent_song,
+    get_cached_playlist,
+    get_current_song as db_get_current_song,
+    get_playlist_window as db_get_playlist_window,
+    get_song_history,
+    get_insert_position,
+    get_song_by_queue_num,
+    get_upcoming_songs,
+    link_is_stale,
+    lock_room,
+    now_playing,
+    playback_clock,
+    playback_state,
+    refresh_song_link,
+    set_playing_link,
+    set_song_links,
+    set_song_metadata,
+    set_song_states,
 )
+from database.tasks import task_store
+from events.bus import EventKind, changelog, playlist_ops, publish
 from models import models, schemas
-from pytube import YouTube
+from pytube import extract
+from routes.dependencies import (
+    encoded_json,
+    locked_room_membership,
+    not_modified,
+    room_etag,
+    room_membership,
+)
+from youtube import resolver
+from youtube.search import search
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+async def resolve_song(room_id: int, song_id: int, video_id: str):
+    """Fetches the song metadata from YouTube once the response has been sent."""
+    try:
+        metadata = await resolver.resolve_metadata(video_id)
+    except Exception:
+        logger.exception("Could not resolve YouTube video %s", video_id)
+        metadata = None
+    async with AsyncSessionLocal() as db:
+        room = await db.get(models.Room, room_id)
+        if room is None:
+            return
+        await set_song_metadata(song_id, metadata, db)
+        version = await bump_room_version(room, db)
+        await db.commit()
+    if metadata is None:
+        payload = dict(id=song_id, resolve_state=models.ResolveState.failed)
+    else:
+        payload = dict(
+            metadata._asdict(), id=song_id, resolve_state=models.ResolveState.ready
+        )
+    await publish(room_id, version, EventKind.song_updated, payload)
+
+
+# How many songs after the current one get their audio links resolved ahead.
+PREFETCH_TRACKS = int(os.environ.get("PREFETCH_TRACKS", 3))
+
+
+async def prefetch_links(room_id: int):
+    """Resolves the audio links of the next songs before they are played."""
+    async with AsyncSessionLocal() as db:
+        room = await db.get(models.Room, room_id)
+        if room is None:
+            return
+        songs = await get_upcoming_songs(room, PREFETCH_TRACKS, db)
+    # Resolved with the session closed, so no connection waits on YouTube.
+    results = await asyncio.gather(
+        *(refresh_song_link(song) for song in songs), return_exceptions=True
+    )
+    refreshed = []
+    for song, result in zip(songs, results):
+        if isinstance(result, Exception):
+            logger.error(
+                "Could not resolve audio link of song %s", song.id, exc_info=result
+            )
+        elif result:
+            refreshed.append(song)
+    if not refreshed:
+        return
+    async with AsyncSessionLocal() as db:
+        room = await db.get(models.Room, room_id)
+        if room is None:
+            return
+        await set_song_links(refreshed, db)
+        version = await bump_room_version(room, db)
+        await db.commit()
+    await publish(
+        room_id,
+        version,
+        EventKind.links_refreshed,
+        dict(songs=[dict(id=song.id, link=song.link) for song in refreshed]),
+    )
+
+
+# Most songs one import adds, and how many are resolved between progress reports.
+MAX_IMPORT_SONGS = int(os.environ.get("MAX_IMPORT_SONGS", 200))
+IMPORT_BATCH = 10
+
+
+async def run_song_import(
+    task_id: str,
+    room_id: int,
+    user_id: int,
+    video_ids: list[str],
+    playlist: Optional[str],
+):
+    """Adds the songs of an import to the playlist, then resolves them, reporting progress to the task store."""
+    try:
+        if playlist is not None:
+            await task_store.set(task_id, "PROGRESS", dict(stage="listing"))
+            video_ids = video_ids + await resolver.run_in_pool(
+                resolver.fetch_playlist_video_ids, playlist, MAX_IMPORT_SONGS
+            )
+        video_ids = video_ids[:MAX_IMPORT_SONGS]
+        if not video_ids:
+            await task_store.set(task_id, "SUCCESS", dict(added=0, failed=0))
+            return
+        async with AsyncSessionLocal() as db:
+            room = await db.get(models.Room, room_id)
+            if room is None:
+                raise ValueError("The room has been deleted.")
+            await lock_room(room, db)
+            songs = await add_songs(room, user_id, video_ids, db)
+            version = await bump_room_version(room, db)
+            await db.commit()
+        await publish(
+            room_id,
+            version,
+            EventKind.songs_added,
+            dict(songs=jsonable_encoder([schemas.Song.from_orm(s) for s in songs])),
+        )
+
+        total, failed = len(songs), 0
+        progress = dict(stage="resolving", total=total, resolved=0, failed=0)
+        await task_store.set(task_id, "PROGRESS", progress)
+        for start in range(0, total, IMPORT_BATCH):
+            batch = songs[start : start + IMPORT_BATCH]
+            # The resolver pool bounds how many videos are fetched at once.
+            results = await asyncio.gather(
+                *(resolver.resolve_metadata(song.video_id) for song in batch),
+                return_exceptions=True,
+            )
+            updated = []
+            async with AsyncSessionLocal() as db:
+                room = await db.get(models.Room, room_id)
+                if room is None:
+                    raise ValueError("The room has been deleted.")
+                for song, metadata in zip(batch, results):
+                    if isinstance(metadata, Exception):
+                        logger.error(
+                            "Could not resolve YouTube video %s",
+                            song.video_id,
+                            exc_info=metadata,
+                        )
+                        metadata = None
+                        failed += 1
+                    await set_song_metadata(song.id, metadata, db)
+                    if metadata is None:
+                        updated.append(
+                            dict(id=song.id, resolve_state=models.ResolveState.failed)
+                        )
+                    else:
+                        updated.append(
+                            dict(
+                                metadata._asdict(),
+                                id=song.id,
+                                resolve_state=models.ResolveState.ready,
+                            )
+                        )
+                version = await bump_room_version(room, db)
+                await db.commit()
+            await publish(
+                room_id, version, EventKind.songs_updated, dict(songs=updated)
+            )
+            progress.update(resolved=start + len(batch) - failed, failed=failed)
+            await task_store.set(task_id, "PROGRESS", progress)
+        await task_store.set(
+            task_id,
+            "SUCCESS",
+            dict(added=total, failed=failed, song_ids=[song.id for song in songs]),
+        )
+    except Exception as e:
+        logger.exception("Song import %s failed", task_id)
+        await task_store.set(task_id, "FAILURE", str(e))
+
+
+async def resolve_playing_link(
+    room: models.Room, song: models.Song, db: AsyncSession
+) -> Optional[int]:
+    """
+    Resolves the audio link of the song just made current, if it has none that is good to play.
+
+    Call it once the change is committed: the room lock is released by then, so a
+    slow YouTube doesn't hold up the room. Returns the room version that wrote the link.
+    """
+    if not link_is_stale(song):
+        return None
+    try:
+        stream = await resolver.resolve_stream(song.video_id)
+    except Exception:
+        # The old link may still work, so playback goes on.
+        logger.exception("Could not resolve audio link of song %s", song.id)
+        return None
+    await set_playing_link(room, song, stream, db)
+    version = await bump_room_version(room, db)
+    await db.commit()
+    return version
+
+
+async def publish_playing_link(room_id: int, version: Optional[int], song: models.Song):
+    if version is not None:
+        await publish(
+            room_id,
+            version,
+            EventKind.links_refreshed,
+            dict(songs=[dict(id=song.id, link=song.link)]),
+        )
+
+
+async def play_song(
+    room: models.Room,
+    song: models.Song,
+    db: AsyncSession,
+    background_tasks: BackgroundTasks,
+) -> schemas.NowPlaying:
+    """Makes `song` the current one, with an audio link that is good to play, and starts its clock."""
+    room.current_song_id = song.id
+    room.playback_started_at = datetime.datetime.now(datetime.timezone.utc)
+    room.playback_paused_at = None
+    song.played_at = room.playback_started_at
+    version = await bump_room_version(room, db)
+    await db.commit()
+    link_version = await resolve_playing_link(room, song, db)
+    song.status = models.SongState.is_playing
+    playing = now_playing(room, song)
+    await publish(room.id, version, EventKind.now_playing, jsonable_encoder(playing))
+    await publish_playing_link(room.id, link_version, song)
+    background_tasks.add_task(prefetch_links, room.id)
+    return playing
+
+
+async def set_paused(room: models.Room, paused: bool, db: AsyncSession):
+    """Stops or restarts the clock of the current song."""
+    song = await db_get_current_song(room, db)
+    if song is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Nothing is playing."
+        )
+    if paused != (room.playback_paused_at is not None):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if room.playback_started_at is None:
+            # Songs that were playing before rooms had a clock start it now.
+            room.playback_started_at = now
+        if paused:
+            room.playback_paused_at = now
+        else:
+            # Shifted by the pause, so the song goes on where it stopped.
+            room.playback_started_at += now - room.playback_paused_at
+            room.playback_paused_at = None
+        version = await bump_room_version(room, db)
+        await db.commit()
+        playing = now_playing(room, song)
+        await publish(
+            room.id, version, EventKind.now_playing, jsonable_encoder(playing)
+        )
+        return playing
+    return now_playing(room, song)
 
 
 @router.post(
@@ -26,90 +309,61 @@ router = APIRouter()
     tags=["Songs"],
 )
 async def add_song(
+    background_tasks: BackgroundTasks,
     link: str = Query(
         ..., description="""YouTube link to the music video or phrase to search"""
     ),
     queue_num: Optional[int] = Query(
         None,
-        description="""Index of song in playlist after which this **Song** should be put in.""",
+        description="""Index of song in playlist after which this **Song** should be put in. Use 0 to put it first.""",
     ),
-    session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Adds a **Song** to the **Room** playlist or searches for this song in the YT.
 
     Returns a **Song** object if link given. If search phrase is given, returns list of links instead.
 
+    The **Song** is returned in the *resolving* state: its title and audio link are filled in shortly after.
+
         Note that this method does not play a song. To play a song use /playnext, /playprev or /playthis instead.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
-
-        yt = YouTube(link)
-        avatar = f"https://img.youtube.com/vi/{yt.video_id}/hqdefault.jpg"
-
-        playlist: list[models.Song] = get_room_playlist(room, db)
-        if queue_num is None:
-            if len(playlist) == 0:
-                song = models.Song(
-                    user=user,
-                    link=yt.streams.filter(only_audio=True)[0].url,
-                    title=yt.title,
-                    avatar=avatar,
-                    room=room,
-                    queue_num=1,
-                    status=models.SongState.in_queue,
-                )
-                db.add(song)
-                db.commit()
-                return song
-            queue_num = max([i.queue_num for i in playlist])
-        if all(i.queue_num != queue_num for i in playlist):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"No song found with queue index {queue_num}",
-            )
+        user, room = membership.user, membership.room
 
-        for i in range(len(playlist)):
-            if playlist[i].queue_num == queue_num:
-                song = models.Song(
-                    user=user,
-                    link=yt.streams.filter(only_audio=True)[0].url,
-                    title=yt.title,
-                    room=room,
-                    avatar=avatar,
-                    queue_num=queue_num + 1,
-                    status=models.SongState.in_queue,
-                )
-                db.add(song)
-            if playlist[i].queue_num > queue_num:
-                setattr(playlist[i], "queue_num", playlist[i].queue_num + 1)
-        db.commit()
-    except pytube.exceptions.RegexMatchError:
-        res: list[pytube.YouTube] = pytube.Search(link).results.copy()
-        if res:
-            if len(res) > 5:
-                res = res[:5]
-            res = [
-                {
-                    "link": "https://www.youtube.com/watch?v=" + i.video_id,
-                    "title": i.title,
-                    "img": f"https://img.youtube.com/vi/{i.video_id}/hqdefault.jpg",
-                }
-                for i in res
-            ]
+        video_id = extract.video_id(link)
+        # Locked only now, so a search phrase doesn't hold up the room's
+        # playlist while YouTube is searched.
+        await lock_room(room, db)
 
+        position, song_queue_num = await get_insert_position(room, queue_num, db)
+        song = models.Song(
+            user=user,
+            video_id=video_id,
+            link=resolver.watch_url(video_id),
+            avatar=resolver.thumbnail_url(video_id),
+            room=room,
+            position=position,
+            resolve_state=models.ResolveState.resolving,
+        )
+        db.add(song)
+        version = await bump_room_version(room, db)
+        await db.commit()
+        song.queue_num = song_queue_num
+        background_tasks.add_task(resolve_song, room.id, song.id, video_id)
+        set_song_states([song], await db_get_current_song(room, db))
+        await publish(
+            room.id,
+            version,
+            EventKind.song_added,
+            jsonable_encoder(schemas.Song.from_orm(song)),
+        )
+    except pytube.exceptions.RegexMatchError:
+        res = await search(link)
         return Response(
             status_code=449, content=json.dumps(res), media_type="application/json"
         )  # Retry with
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
-        )
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -117,63 +371,109 @@ async def add_song(
     return song
 
 
+@router.post(
+    "/import_songs",
+    dependencies=[Depends(cookie)],
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=schemas.Task,
+    tags=["Songs"],
+)
+async def import_songs(
+    background_tasks: BackgroundTasks,
+    songs: schemas.SongImport = Body(...),
+    membership: Membership = Depends(room_membership),
+):
+    """
+    Adds the videos of a YouTube *playlist* and/or a list of YouTube *links* at the end of the **Room** playlist.
+
+    Returns a *task_id*: /tasks/{task_id} reports the progress, while the **Songs** are added and their titles are fetched from YouTube.
+    The room events tell about the new **Songs** as well.
+    """
+    try:
+        try:
+            video_ids = [extract.video_id(link) for link in songs.links]
+            if songs.playlist is not None:
+                extract.playlist_id(songs.playlist)
+        except (pytube.exceptions.RegexMatchError, KeyError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only YouTube video and playlist links can be imported.",
+            )
+        if not video_ids and songs.playlist is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Nothing to import.",
+            )
+        task_id = task_store.new_id()
+        await task_store.set(task_id, "PENDING")
+        background_tasks.add_task(
+            run_song_import,
+            task_id,
+            membership.room.id,
+            membership.user.id,
+            video_ids,
+            songs.playlist,
+        )
+        return schemas.Task(task_id=task_id)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get(
+    "/search",
+    dependencies=[Depends(cookie)],
+    response_model=list[schemas.SearchResult],
+    tags=["Songs"],
+)
+async def search_songs(
+    query: str = Query(..., description="""Phrase to search in the YT"""),
+):
+    """
+    Searches for songs in the YT.
+
+    Returns the same list of links as /add_song does when given a search phrase.
+    """
+    try:
+        return await search(query)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.patch(
     "/playnext",
     dependencies=[Depends(cookie)],
-    response_model=schemas.Song,
+    response_model=schemas.NowPlaying,
     tags=["Songs"],
 )
 async def playnext(
-    session_data: SessionData = Depends(verifier), db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    current_id: Optional[int] = Query(
+        None, description="""Id of the Song the client is done playing"""
+    ),
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Plays next **Song** in the **Room** playlist.
 
-    Returns a currently playing **Song** object.
+    With *current_id*, the playlist only moves on if that **Song** is still playing.
+    Every listener can then call it once its clock reaches the end of the song, and the room skips only one song.
+
+    Returns a currently playing **Song** object with its playback clock.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
-        playlist: list[models.Song] = get_room_playlist(room, db)
-        if not playlist:
+        room = membership.room
+        current = await db_get_current_song(room, db)
+        if current is not None and current_id not in (None, current.id):
+            return now_playing(room, current)
+        song = await get_adjacent_song(room, current, True, db)
+        if song is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Playlist is empty."
             )
-        if len(playlist) == 1:
-            setattr(playlist[0], "status", models.SongState.is_playing)
-            db.commit()
-            return playlist[0]
-        current_index = max(
-            [
-                i.queue_num if i.status == models.SongState.is_playing else 0
-                for i in playlist
-            ]
-        )
-        if not current_index:
-            setattr(playlist[0], "status", models.SongState.is_playing)
-            db.commit()
-            return playlist[0]
-        if current_index == playlist[-1].queue_num:
-            setattr(playlist[0], "status", models.SongState.is_playing)
-            for i in playlist[1:]:
-                setattr(i, "status", models.SongState.in_queue)
-            db.commit()
-            return playlist[0]
-        else:
-            for i in playlist:
-                if i.queue_num == current_index:
-                    setattr(i, "status", models.SongState.played)
-                elif i.queue_num == current_index + 1:
-                    setattr(i, "status", models.SongState.is_playing)
-                    song = i
-            db.commit()
-            return song
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
-        )
+        return await play_song(room, song, db, background_tasks)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -183,55 +483,28 @@ async def playnext(
 @router.patch(
     "/playprev",
     dependencies=[Depends(cookie)],
-    response_model=schemas.Song,
+    response_model=schemas.NowPlaying,
     tags=["Songs"],
 )
 async def playprev(
-    session_data: SessionData = Depends(verifier), db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Plays previous **Song** in the **Room** playlist.
 
-    Returns a currently playing **Song** object.
+    Returns a currently playing **Song** object with its playback clock.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
-        playlist: list[models.Song] = get_room_playlist(room, db)
-        if not playlist:
+        room = membership.room
+        current = await db_get_current_song(room, db)
+        song = await get_adjacent_song(room, current, False, db)
+        if song is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Playlist is empty."
             )
-        if len(playlist) == 1:
-            setattr(playlist[0], "status", models.SongState.is_playing)
-            db.commit()
-            return playlist[0]
-        current_index = max(
-            [
-                i.queue_num if i.status == models.SongState.is_playing else 0
-                for i in playlist
-            ]
-        )
-        if current_index == playlist[0].queue_num:
-            setattr(playlist[-1], "status", models.SongState.is_playing)
-            setattr(playlist[0], "status", models.SongState.in_queue)
-            db.commit()
-            return playlist[-1]
-        else:
-            for i in playlist:
-                if i.queue_num == current_index:
-                    setattr(i, "status", models.SongState.in_queue)
-                elif i.queue_num == current_index - 1:
-                    setattr(i, "status", models.SongState.is_playing)
-                    song = i
-            db.commit()
-            return song
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
-        )
+        return await play_song(room, song, db, background_tasks)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -241,48 +514,70 @@ async def playprev(
 @router.patch(
     "/playthis",
     dependencies=[Depends(cookie)],
-    response_model=schemas.Song,
+    response_model=schemas.NowPlaying,
     tags=["Songs"],
 )
 async def playthis(
+    background_tasks: BackgroundTasks,
     queue_num: int = Query(..., description="""Song index"""),
-    session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Plays a chosen **Song** in the **Room** playlist.
 
-    Returns a currently playing **Song** object.
+    Returns a currently playing **Song** object with its playback clock.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
-        playlist: list[models.Song] = get_room_playlist(room, db)
-        if not playlist:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Playlist is empty."
-            )
-        if all(i.queue_num != queue_num for i in playlist):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"There is no song in this room playlist with index {queue_num}.",
-            )
-        for i in playlist:
-            if i.queue_num < queue_num:
-                setattr(i, "status", models.SongState.played)
-            elif i.queue_num > queue_num:
-                setattr(i, "status", models.SongState.in_queue)
-            else:
-                setattr(i, "status", models.SongState.is_playing)
-                song = i
-        db.commit()
-        return song
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
-        )
+        room = membership.room
+        song = await get_song_by_queue_num(room, queue_num, db)
+        return await play_song(room, song, db, background_tasks)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.patch(
+    "/pause",
+    dependencies=[Depends(cookie)],
+    response_model=schemas.NowPlaying,
+    tags=["Songs"],
+)
+async def pause(
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Pauses the currently playing **Song** for everyone in the **Room**.
+
+    Returns a currently playing **Song** object with its playback clock.
+    """
+    try:
+        return await set_paused(membership.room, True, db)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.patch(
+    "/resume",
+    dependencies=[Depends(cookie)],
+    response_model=schemas.NowPlaying,
+    tags=["Songs"],
+)
+async def resume(
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Resumes the paused **Song** for everyone in the **Room**, where it was paused.
+
+    Returns a currently playing **Song** object with its playback clock.
+    """
+    try:
+        return await set_paused(membership.room, False, db)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -298,65 +593,39 @@ async def playthis(
 async def swap_songs(
     queue_num1: int = Query(..., description="""Song index"""),
     queue_num2: int = Query(..., description="""Song index"""),
-    session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Swaps **Songs** with given indexes in the room playlist.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
-        playlist: list[models.Song] = get_room_playlist(room, db)
+        room = membership.room
         l, h = (
             min(queue_num1, queue_num2),
             max(queue_num1, queue_num2),
         )  # lower, higher in playlist
-        current_index = max(
-            [
-                i.queue_num if i.status == models.SongState.is_playing else 0
-                for i in playlist
-            ]
-        )
-        if all(i.queue_num != l for i in playlist) or all(
-            i.queue_num != h for i in playlist
-        ):
+        try:
+            low = await get_song_by_queue_num(room, l, db)
+            high = await get_song_by_queue_num(room, h, db)
+        except HTTPException:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"There is no song in this room playlist with index {l} or with index {h}.",
             )
         if l == h:
             return schemas.Success()
-        if not current_index or current_index < l or current_index > h:
-            for i in playlist:
-                if i.queue_num == l:
-                    setattr(i, "queue_num", h)
-                elif i.queue_num == h:
-                    setattr(i, "queue_num", l)
-            db.commit()
-            return schemas.Success()
-        if current_index == l:
-            for i in range(l + 1, h):
-                setattr(playlist[i - 1], "status", models.SongState.played)
-            setattr(playlist[h - 1], "status", models.SongState.played)
-        elif current_index == h:
-            for i in range(l + 1, h):
-                setattr(playlist[i - 1], "status", models.SongState.in_queue)
-            setattr(playlist[l - 1], "status", models.SongState.in_queue)
-        else:
-            setattr(playlist[h - 1], "status", models.SongState.played)
-            setattr(playlist[l - 1], "status", models.SongState.in_queue)
-        setattr(playlist[h - 1], "queue_num", l)
-        setattr(playlist[l - 1], "queue_num", h)
-        db.commit()
-        return schemas.Success()
-
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
+        # Song states follow the current song pointer, so only positions change.
+        low.position, high.position = high.position, low.position
+        version = await bump_room_version(room, db)
+        await db.commit()
+        await publish(
+            room.id,
+            version,
+            EventKind.songs_swapped,
+            dict(queue_num1=l, queue_num2=h, id1=low.id, id2=high.id),
         )
+        return schemas.Success()
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -371,8 +640,8 @@ async def swap_songs(
 )
 async def delete_song(
     queue_num: int = Query(..., description="""Song index"""),
-    session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Deletes a chosen **Song** from the **Room** playlist if **User** has a permission to do this action.
@@ -380,9 +649,7 @@ async def delete_song(
     Returns a deleted **Song** object.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
+        a, room = membership.association, membership.room
         if a.usertype not in (
             models.UserType.host,
             models.UserType.moder,
@@ -392,24 +659,18 @@ async def delete_song(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="This user has no permission to perform this action.",
             )
-        playlist: list[models.Song] = get_room_playlist(room, db)
-        if all(i.queue_num != queue_num for i in playlist):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"There is no song in this room playlist with index {queue_num}.",
-            )
-        for i in range(len(playlist)):
-            if i + 1 == queue_num:
-                song = playlist[i]
-                continue
-            if i + 1 > queue_num:
-                setattr(playlist[i], "queue_num", playlist[i].queue_num - 1)
-        db.delete(song)
-        db.commit()
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
+        song = await get_song_by_queue_num(room, queue_num, db)
+        set_song_states([song], await db_get_current_song(room, db))
+        if room.current_song_id == song.id:
+            room.current_song_id = None
+        await db.delete(song)
+        version = await bump_room_version(room, db)
+        await db.commit()
+        await publish(
+            room.id,
+            version,
+            EventKind.song_deleted,
+            dict(id=song.id, queue_num=queue_num),
         )
     except HTTPException as e:
         raise e
@@ -418,34 +679,117 @@ async def delete_song(
     return song
 
 
+# Most operations one /edit_playlist call takes.
+MAX_QUEUE_OPS = int(os.environ.get("MAX_QUEUE_OPS", 500))
+
+
+@router.patch(
+    "/edit_playlist",
+    dependencies=[Depends(cookie)],
+    response_model=schemas.Playlist,
+    tags=["Songs"],
+)
+async def edit_playlist(
+    background_tasks: BackgroundTasks,
+    operations: list[schemas.QueueOperation] = Body(...),
+    membership: Membership = Depends(locked_room_membership),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Applies a list of operations to the **Room** playlist at once: either all of them or, if one does not fit, none.
+    - `move`: moves the **Song** at `queue_num` so that it is at `to`;
+    - `delete`: deletes the **Song** at `queue_num`;
+    - `insert`: adds the YouTube `link` after the `queue_num`-th **Song**, first with 0, last without `queue_num`;
+    - `play`: plays the **Song** at `queue_num`.
+
+    Every `queue_num` refers to the playlist as the operations before left it.
+    Returns the resulting playlist with the room version, which the whole list bumps once.
+    """
+    try:
+        user, a, room = membership
+        if len(operations) > MAX_QUEUE_OPS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"No more than {MAX_QUEUE_OPS} operations at once.",
+            )
+        if a.usertype not in (
+            models.UserType.host,
+            models.UserType.moder,
+            models.UserType.basic,
+        ) and any(operation.op == "delete" for operation in operations):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="This user has no permission to perform this action.",
+            )
+        was_playing = room.current_song_id is not None
+        change = await apply_queue_ops(room, user, operations, db)
+        playing = change.played
+        if playing is not None:
+            room.playback_started_at = datetime.datetime.now(datetime.timezone.utc)
+            room.playback_paused_at = None
+            playing.played_at = room.playback_started_at
+        version = await bump_room_version(room, db)
+        await db.commit()
+
+        payload = dict(ops=change.ops())
+        link_version = None
+        if playing is not None:
+            link_version = await resolve_playing_link(room, playing, db)
+            payload["now_playing"] = jsonable_encoder(now_playing(room, playing))
+            background_tasks.add_task(prefetch_links, room.id)
+        elif was_playing and room.current_song_id is None:
+            payload["now_playing"] = None  # the playing song was deleted
+        for song in change.added:
+            background_tasks.add_task(resolve_song, room.id, song.id, song.video_id)
+        await publish(room.id, version, EventKind.queue_changed, payload)
+        if playing is not None:
+            await publish_playing_link(room.id, link_version, playing)
+        return schemas.Playlist(songs=change.songs, version=version)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.get(
     "/get_current_song",
     dependencies=[Depends(cookie)],
-    response_model=schemas.Song,
+    response_model=schemas.NowPlaying,
     tags=["Songs"],
 )
 async def get_current_song(
-    session_data: SessionData = Depends(verifier), db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
-    Returns a currently playing **Song** object.
+    Returns a currently playing **Song** object with its playback clock.
+
+    *position* is where the song is at *server_time*: clients can play along, and know when the song ends, without asking again.
+
+    Answers *304 Not Modified* if the room has not changed since the *ETag* given in *If-None-Match*.
+    The clock of a cached response still holds, as *started_at* only changes along with the room.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
-        playlist = get_room_playlist(room, db)
-
-        for i in playlist:
-            if i.status == models.SongState.is_playing:
-                return i
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Nothing is playing."
-        )
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
+        room = membership.room
+        cached = not_modified(request, response, room_etag(room))
+        if cached is not None:
+            return cached
+
+        async def load():
+            song = await db_get_current_song(room, db)
+            if song is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Nothing is playing."
+                )
+            return playback_state(room, song)
+
+        return await encoded_json(
+            f"now_playing:{room.id}:{room.version}",
+            response,
+            load,
+            extra=playback_clock(room),
         )
     except HTTPException as e:
         raise e
@@ -456,25 +800,130 @@ async def get_current_song(
 @router.get(
     "/get_playlist",
     dependencies=[Depends(cookie)],
-    response_model=schemas.Playlist,
+    response_model=Union[schemas.PlaylistDelta, schemas.Playlist],
     tags=["Songs"],
 )
 async def get_playlist(
-    session_data: SessionData = Depends(verifier), db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    since: Optional[int] = Query(
+        None, description="""Room version the client's playlist is at"""
+    ),
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
-    Returns *current* room playlist as a list of **Song** objects.
+    Returns *current* room playlist as a list of **Song** objects, along with the room version.
+
+    With *since*, returns only the operations that bring a playlist from that version to the current one, in order:
+    - `insert`: `song` was added at its `queue_num`;
+    - `remove`: the song `id` was deleted;
+    - `move`: the song `id` is now at `queue_num`, once the song is taken out of the playlist;
+    - `status`: the song `id` is now playing, the songs before it are played and the songs after it are in queue;
+    - `update`: fields of `song` changed;
+    - `user`: `user` of the songs changed.
+
+    Operations are keyed by song id, so applying one that the playlist already reflects changes nothing.
+    If the changes are no longer kept, returns the whole playlist instead.
+
+    Answers *304 Not Modified* if the room has not changed since the *ETag* given in *If-None-Match*.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        a = db.query(models.Association).filter(models.Association.user == user).one()
-        room = db.query(models.Room).filter(models.Room.id == a.room_id).one()
-        return schemas.Playlist(songs=get_room_playlist(room, db))
-    except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="This user has no association with any room.",
+        room = membership.room
+        cached = not_modified(request, response, room_etag(room))
+        if cached is not None:
+            return cached
+        if since is not None and since <= room.version:
+            events = await changelog.since(room.id, since, room.version)
+            if events is not None:
+                return schemas.PlaylistDelta(
+                    version=room.version,
+                    ops=[op for event in events for op in playlist_ops(event)],
+                )
+
+        async def load():
+            return dict(songs=await get_cached_playlist(room, db), version=room.version)
+
+        return await encoded_json(f"playlist:{room.id}:{room.version}", response, load)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get(
+    "/get_playlist_window",
+    dependencies=[Depends(cookie)],
+    response_model=schemas.PlaylistWindow,
+    tags=["Songs"],
+)
+async def get_playlist_window(
+    request: Request,
+    response: Response,
+    before: int = Query(
+        10, ge=0, le=100, description="""Songs before the current one"""
+    ),
+    after: int = Query(20, ge=0, le=100, description="""Songs after the current one"""),
+    before_cursor: Optional[int] = Query(
+        None, description="""*prev_cursor* of a window, to page back from it"""
+    ),
+    after_cursor: Optional[int] = Query(
+        None, description="""*next_cursor* of a window, to page on from it"""
+    ),
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Returns a part of *current* room playlist: *before* **Songs** before the currently playing one, the playing one and *after* **Songs** after it.
+    If nothing plays, the window starts at the head of the playlist.
+
+    *prev_cursor* and *next_cursor* page further: pass one as *before_cursor* (to get *before* more songs) or as *after_cursor* (to get *after* more songs).
+    They are null once there are no more songs that way.
+
+    Answers *304 Not Modified* if the room has not changed since the *ETag* given in *If-None-Match*.
+    """
+    try:
+        room = membership.room
+        cached = not_modified(request, response, room_etag(room))
+        if cached is not None:
+            return cached
+        window = await db_get_playlist_window(
+            room,
+            before,
+            after,
+            db,
+            before_cursor=before_cursor,
+            after_cursor=after_cursor,
         )
+        return schemas.PlaylistWindow(**window._asdict(), version=room.version)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get(
+    "/get_history",
+    dependencies=[Depends(cookie)],
+    response_model=schemas.SongHistory,
+    tags=["Songs"],
+)
+async def get_history(
+    limit: int = Query(20, ge=1, le=100, description="""Songs per page"""),
+    cursor: Optional[int] = Query(
+        None, description="""*next_cursor* of the previous page"""
+    ),
+    membership: Membership = Depends(room_membership),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Returns **Songs** played in *current* room long enough ago to have left the playlist, latest first.
+
+    Pass *next_cursor* as *cursor* to get the next page. It is null on the last page.
+    """
+    try:
+        songs, next_cursor = await get_song_history(membership.room, limit, cursor, db)
+        return schemas.SongHistory(songs=songs, next_cursor=next_cursor)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -3,22 +3,42 @@ from typing import Optional
 
 from helpers import save_file
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile
+from fastapi.encoders import jsonable_encoder
 from fastapi.params import Query, File
-from sqlalchemy.exc import IntegrityError, NoResultFound
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from FastApi_sessions.fastapi_session import SessionData, backend, cookie, verifier
 from database.db import get_db
 from db_methods.db_methods import (
+    Membership,
+    bump_room_version,
     create_user as db_create_user,
     get_user_by_session,
 )
-from models import models, schemas
+from events.bus import EventKind, publish
+from models import schemas
+from routes.dependencies import current_membership
 from uuid import UUID
 
 router = APIRouter()
 
 
+async def commit_user_change(membership: Membership, db: AsyncSession):
+    """Commits a change of the user and tells the roommates about it."""
+    if membership.room is None:
+        await db.commit()
+        return
+    version = await bump_room_version(membership.room, db)
+    await db.commit()
+    await publish(
+        membership.room.id,
+        version,
+        EventKind.user_updated,
+        jsonable_encoder(schemas.User.from_orm(membership.user)),
+    )
+
+
 @router.post(
     "/create_user",
     dependencies=[Depends(cookie)],
@@ -29,7 +49,7 @@ async def create_user(
     name: str = Query(..., description="""User name"""),
     avatar: Optional[UploadFile] = File(None, description="""User avatar"""),
     session_data: SessionData = Depends(verifier),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Creates a **User** for current session if one is not created yet.
@@ -43,14 +63,14 @@ async def create_user(
 
             await save_file(avatar, out_path)
         session_id = session_data.dict()["session_id"]
-        db_create_user(
+        await db_create_user(
             avatar=out_path if avatar is not None else None,
             name=name,
             session_id=session_id,
             db=db,
         )
-        db.commit()
-        user = get_user_by_session(session_id, db)
+        await db.commit()
+        user = await get_user_by_session(session_id, db)
         data = SessionData(username=name, userid=user.id, session_id=session_id)
         await backend.update(session_id=UUID(session_id), data=data)
     except IntegrityError as e:
@@ -73,8 +93,8 @@ async def create_user(
 )
 async def update_avatar(
     avatar: Optional[UploadFile] = File(None, description="""New avatar"""),
-    session_data: SessionData = Depends((verifier)),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(current_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Updates or deletes **User** avatar image.
@@ -87,9 +107,9 @@ async def update_avatar(
             out_path = f"images/{filename}"
 
             await save_file(avatar, out_path)
-        user = get_user_by_session(session_data.session_id, db)
+        user = membership.user
         setattr(user, "avatar", out_path if avatar is not None else None)
-        db.commit()
+        await commit_user_change(membership, db)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -105,8 +125,8 @@ async def update_avatar(
 )
 async def rename_user(
     name: str = Query(..., description="""New name"""),
-    session_data: SessionData = Depends((verifier)),
-    db: Session = Depends(get_db),
+    membership: Membership = Depends(current_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Changes **name** of *current* session's user.
@@ -114,13 +134,11 @@ async def rename_user(
     </br>Returns a **User** object.
     """
     try:
-        user = get_user_by_session(session_data.session_id, db)
+        user = membership.user
         setattr(user, "name", name)
-        db.commit()
-        data = SessionData(
-            username=name, userid=user.id, session_id=session_data.session_id
-        )
-        await backend.update(session_id=UUID(session_data.session_id), data=data)
+        await commit_user_change(membership, db)
+        data = SessionData(username=name, userid=user.id, session_id=user.session_id)
+        await backend.update(session_id=UUID(user.session_id), data=data)
 
     except HTTPException as e:
         raise e
@@ -136,7 +154,8 @@ async def rename_user(
     tags=["User"],
 )
 async def delete_user(
-    session_data: SessionData = Depends((verifier)), db: Session = Depends(get_db)
+    membership: Membership = Depends(current_membership),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Deletes a *current* session's **User**.
@@ -144,18 +163,18 @@ async def delete_user(
     </br>Returns a **User** object.
     """
     try:
-        user: models.User = get_user_by_session(session_data.session_id, db)
-        try:
-            a = (
-                db.query(models.Association)
-                .filter(models.Association.user == user)
-                .one()
+        user = membership.user
+        if membership.association is not None:
+            await db.delete(membership.association)
+        await db.delete(user)
+        if membership.room is None:
+            await db.commit()
+        else:
+            version = await bump_room_version(membership.room, db)
+            await db.commit()
+            await publish(
+                membership.room.id, version, EventKind.user_left, dict(user_id=user.id)
             )
-            db.delete(a)
-        except NoResultFound:
-            pass
-        db.delete(user)
-        db.commit()
     except HTTPException as e:
         raise e
     except Exception as e:
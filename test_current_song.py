@@ -0,0 +1,75 @@
+def statuses(client):
+    return [song["status"] for song in client.get("/get_playlist").json()["songs"]]
+
+
+def current_song_id(room_id):
+    from database.db import SessionLocal
+    from models import models
+
+    with SessionLocal() as db:
+        return db.get(models.Room, room_id).current_song_id
+
+
+def test_playnext_wraps_to_the_first_song(make_room, seed_songs):
+    host, room, user_id = make_room("wrap next")
+    seed_songs(room["id"], user_id, 3)
+
+    assert host.patch("/playnext").json()["queue_num"] == 1  # nothing was playing
+    assert host.patch("/playthis", params={"queue_num": 3}).json()["queue_num"] == 3
+    assert statuses(host) == [2, 2, 1]  # played, played, playing
+
+    playing = host.patch("/playnext").json()
+    assert (playing["queue_num"], playing["title"]) == (1, "Song 0")
+    assert statuses(host) == [1, 0, 0]  # playing, in queue, in queue
+
+
+def test_playprev_wraps_to_the_last_song(make_room, seed_songs):
+    host, room, user_id = make_room("wrap prev")
+    seed_songs(room["id"], user_id, 3)
+    host.patch("/playthis", params={"queue_num": 1}).raise_for_status()
+
+    playing = host.patch("/playprev").json()
+    assert (playing["queue_num"], playing["title"]) == (3, "Song 2")
+    assert statuses(host) == [2, 2, 1]
+    assert host.patch("/playprev").json()["queue_num"] == 2
+
+
+def test_playthis_moves_the_current_song(make_room, seed_songs):
+    host, room, user_id = make_room("play this")
+    seed_songs(room["id"], user_id, 4)
+
+    playing = host.patch("/playthis", params={"queue_num": 2}).json()
+    assert playing["title"] == "Song 1"
+    assert current_song_id(room["id"]) == playing["id"]
+    assert statuses(host) == [2, 1, 0, 0]
+    assert host.patch("/playthis", params={"queue_num": 5}).status_code == 404
+    assert current_song_id(room["id"]) == playing["id"]
+
+
+def test_swapping_the_playing_song_keeps_it_playing(make_room, seed_songs):
+    host, room, user_id = make_room("swap playing")
+    seed_songs(room["id"], user_id, 3)
+    playing = host.patch("/playthis", params={"queue_num": 1}).json()
+
+    host.patch(
+        "/swap_songs", params={"queue_num1": 1, "queue_num2": 3}
+    ).raise_for_status()
+
+    current = host.get("/get_current_song").json()
+    assert (current["id"], current["queue_num"]) == (playing["id"], 3)
+    # The songs now before it count as played.
+    assert statuses(host) == [2, 2, 1]
+    assert host.patch("/playnext").json()["title"] == "Song 2"
+
+
+def test_deleting_the_playing_song_clears_the_current_song(make_room, seed_songs):
+    host, room, user_id = make_room("delete playing")
+    seed_songs(room["id"], user_id, 3)
+    host.patch("/playthis", params={"queue_num": 2}).raise_for_status()
+
+    deleted = host.delete("/delete_song", params={"queue_num": 2}).json()
+    assert deleted["title"] == "Song 1"
+    assert current_song_id(room["id"]) is None
+    assert host.get("/get_current_song").status_code == 404
+    assert statuses(host) == [0, 0]
+    assert host.patch("/playnext").json()["title"] == "Song 0"
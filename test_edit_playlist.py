@@ -0,0 +1,204 @@
+import asyncio
+
+
+def titles(songs):
+    return [song["title"] for song in songs]
+
+
+def ids(songs):
+    return [song["id"] for song in songs]
+
+
+def replay(songs, ops):
+    """The song ids once the operations of a delta are applied, the way a client does."""
+    order = ids(songs)
+    for op in ops:
+        if op["op"] == "insert":
+            order.insert(op["song"]["queue_num"] - 1, op["song"]["id"])
+        elif op["op"] == "move":
+            order.remove(op["id"])
+            order.insert(op["queue_num"] - 1, op["id"])
+        elif op["op"] == "remove":
+            order.remove(op["id"])
+    return order
+
+
+def test_edit_playlist_applies_operations_at_once(
+    make_room, seed_songs, stub_resolver, count_statements
+):
+    from db_methods.db_methods import playlist_cache
+    from routes.dependencies import encoded_responses
+
+    host, room, user_id = make_room("batch")
+    seed_songs(room["id"], user_id, 5)
+    before = host.get("/get_playlist").json()
+    operations = [
+        dict(op="move", queue_num=5, to=1),
+        dict(op="delete", queue_num=3),
+        dict(
+            op="insert", link="https://www.youtube.com/watch?v=dQw4w9WgXcQ", queue_num=1
+        ),
+        dict(op="play", queue_num=2),
+        dict(op="move", queue_num=2, to=5),
+    ]
+
+    with count_statements() as statements:
+        response = host.patch("/edit_playlist", json=operations)
+    assert response.status_code == 200
+    # The background tasks resolving the new song run after the response.
+    bumps = [i for i, s in enumerate(statements) if "UPDATE rooms SET version" in s]
+    request = statements[: bumps[0] + 1]
+    assert sum(s.startswith("SELECT songs.") for s in request) == 1
+    assert sum("INSERT INTO songs" in statement for statement in request) == 1
+
+    edited = response.json()
+    assert edited["version"] == before["version"] + 1
+    assert titles(edited["songs"]) == ["Song 4", "Song 0", "Song 2", "Song 3", None]
+    assert [song["queue_num"] for song in edited["songs"]] == [1, 2, 3, 4, 5]
+    assert [song["status"] for song in edited["songs"]] == [2, 2, 2, 2, 1]
+    assert host.get("/get_current_song").json()["video_id"] == "dQw4w9WgXcQ"
+
+    # The playlist cache followed the operations, and agrees with the database.
+    cached = host.get("/get_playlist").json()
+    asyncio.run(encoded_responses.delete(f"playlist:{room['id']}:{cached['version']}"))
+    asyncio.run(playlist_cache.delete(str(room["id"])))
+    assert host.get("/get_playlist").json() == cached
+    assert titles(cached["songs"]) == [
+        "Song 4",
+        "Song 0",
+        "Song 2",
+        "Song 3",
+        "Title dQw4w9WgXcQ",
+    ]
+
+    delta = host.get("/get_playlist", params={"since": before["version"]}).json()
+    assert [op["op"] for op in delta["ops"]][:4] == [
+        "remove",
+        "move",
+        "insert",
+        "status",
+    ]
+    assert replay(before["songs"], delta["ops"]) == ids(cached["songs"])
+
+
+def test_edit_playlist_ops_forget_songs_added_and_deleted(
+    make_room, seed_songs, stub_resolver
+):
+    from db_methods.db_methods import playlist_cache
+    from routes.dependencies import encoded_responses
+
+    host, room, user_id = make_room("added and deleted")
+    seed_songs(room["id"], user_id, 3)
+    before = host.get("/get_playlist").json()
+    operations = [
+        dict(
+            op="insert", link="https://www.youtube.com/watch?v=dQw4w9WgXcQ", queue_num=0
+        ),
+        dict(op="move", queue_num=4, to=2),
+        dict(op="delete", queue_num=1),
+    ]
+
+    assert host.patch("/edit_playlist", json=operations).status_code == 200
+    cached = host.get("/get_playlist").json()
+    delta = host.get("/get_playlist", params={"since": before["version"]}).json()
+    asyncio.run(encoded_responses.delete(f"playlist:{room['id']}:{cached['version']}"))
+    asyncio.run(playlist_cache.delete(str(room["id"])))
+    fresh = host.get("/get_playlist").json()
+    assert titles(fresh["songs"]) == ["Song 2", "Song 0", "Song 1"]
+    assert cached == fresh
+    assert replay(before["songs"], delta["ops"]) == ids(fresh["songs"])
+
+
+def test_edit_playlist_writes_nothing_if_an_operation_fails(
+    make_room, seed_songs, stub_resolver
+):
+    host, room, user_id = make_room("failed batch")
+    seed_songs(room["id"], user_id, 3)
+    before = host.get("/get_playlist").json()
+
+    response = host.patch(
+        "/edit_playlist",
+        json=[dict(op="delete", queue_num=1), dict(op="move", queue_num=9, to=1)],
+    )
+    assert response.status_code == 404
+    assert "Operation 2" in response.json()["detail"]
+    bad_link = host.patch(
+        "/edit_playlist", json=[dict(op="insert", link="https://example.com/song")]
+    )
+    assert bad_link.status_code == 400
+    assert host.get("/get_playlist").json() == before
+
+
+def test_place_songs_fits_moved_songs_between_the_others():
+    from db_methods.db_methods import POSITION_STEP, place_songs
+    from models import models
+
+    songs = [models.Song(position=p) for p in (10, 11, 20, 30)]
+    head, tail = models.Song(), models.Song()
+    place_songs([head] + songs[2:] + [tail], {head, tail})
+    assert (head.position, tail.position) == (20 - POSITION_STEP, 30 + POSITION_STEP)
+
+    moved = models.Song(position=30)
+    place_songs([songs[0], songs[1], moved, songs[2]], {moved})
+    assert 11 < moved.position < 20
+
+    # No room between 10 and 11, so nothing is placed.
+    assert place_songs([songs[0], moved, songs[1]], {moved}) is False
+    assert [s.position for s in (songs[0], moved, songs[1])] == [10, 15, 11]
+
+
+def test_edit_playlist_rebalances_in_one_statement(
+    make_room, seed_songs, count_statements
+):
+    from sqlalchemy import update
+
+    from database.db import SessionLocal
+    from models import models
+
+    host, room, user_id = make_room("batch rebalance")
+    seed_songs(room["id"], user_id, 6)
+    with SessionLocal() as db:
+        db.execute(
+            update(models.Song)
+            .where(models.Song.room_id == room["id"])
+            .values(position=models.Song.id)
+        )
+        db.commit()
+
+    with count_statements() as statements:
+        response = host.patch(
+            "/edit_playlist",
+            json=[
+                dict(op="move", queue_num=6, to=2),
+                dict(op="move", queue_num=6, to=3),
+            ],
+        )
+    assert response.status_code == 200, response.text
+    assert titles(response.json()["songs"]) == [
+        "Song 0",
+        "Song 5",
+        "Song 4",
+        "Song 1",
+        "Song 2",
+        "Song 3",
+    ]
+    # One UPDATE spreads the playlist out, another places the two moved songs.
+    assert sum(s.startswith("UPDATE songs") for s in statements) == 2
+    assert titles(host.get("/get_playlist").json()["songs"]) == titles(
+        response.json()["songs"]
+    )
+
+
+def test_edit_playlist_requires_operation_fields(make_room, seed_songs):
+    host, room, user_id = make_room("batch fields")
+    seed_songs(room["id"], user_id, 2)
+
+    for operation in (
+        dict(op="move", queue_num=1),
+        dict(op="move", to=1),
+        dict(op="delete"),
+        dict(op="play"),
+        dict(op="insert", queue_num=1),
+    ):
+        response = host.patch("/edit_playlist", json=[operation])
+        assert response.status_code == 422, operation
@@ -0,0 +1,35 @@
+import pytest
+
+
+@pytest.mark.parametrize(
+    "endpoint", ["/get_playlist", "/get_current_song", "/get_roommates"]
+)
+def test_reads_answer_not_modified(endpoint, make_room, seed_songs, count_statements):
+    host, room, user_id = make_room(f"etag {endpoint}")
+    seed_songs(room["id"], user_id, 3)
+    host.patch("/playnext").raise_for_status()
+
+    response = host.get(endpoint)
+    response.raise_for_status()
+    etag = response.headers["ETag"]
+
+    with count_statements() as statements:
+        cached = host.get(endpoint, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert not any("songs" in statement for statement in statements)
+
+    host.patch("/playnext").raise_for_status()
+    changed = host.get(endpoint, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_etag_changes_when_a_roommate_is_renamed(make_room, seed_songs):
+    host, room, user_id = make_room("etag rename")
+    seed_songs(room["id"], user_id, 1)
+    etag = host.get("/get_playlist").headers["ETag"]
+
+    host.patch("/rename_user", params={"name": "renamed"}).raise_for_status()
+
+    assert host.get("/get_playlist", headers={"If-None-Match": etag}).status_code == 200
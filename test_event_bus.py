@@ -0,0 +1,85 @@
+import asyncio
+
+import fakeredis.aioredis
+
+from events.bus import (
+    EventKind,
+    InMemoryBus,
+    InMemoryChangeLog,
+    RedisBus,
+    RedisChangeLog,
+    RoomEvent,
+)
+
+
+def make_event(room_id, version):
+    return RoomEvent(room_id=room_id, version=version, kind=EventKind.now_playing)
+
+
+async def receive(events, count):
+    return [await asyncio.wait_for(events.__anext__(), 1) for _ in range(count)]
+
+
+def test_in_memory_bus_delivers_room_events():
+    async def scenario():
+        bus = InMemoryBus()
+        async with bus.subscribe(1) as first, bus.subscribe(1) as second:
+            await bus.publish(make_event(2, 1))
+            await bus.publish(make_event(1, 1))
+            await bus.publish(make_event(1, 2))
+
+            assert [e.version for e in await receive(first, 2)] == [1, 2]
+            assert [e.version for e in await receive(second, 2)] == [1, 2]
+        assert not bus._subscribers
+
+    asyncio.run(scenario())
+
+
+def test_in_memory_bus_drops_events_of_slow_subscribers():
+    async def scenario():
+        bus = InMemoryBus(queue_size=2)
+        async with bus.subscribe(1) as events:
+            for version in (1, 2, 3):
+                await bus.publish(make_event(1, version))
+            await asyncio.sleep(0)
+
+            assert [e.version for e in await receive(events, 2)] == [1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_redis_bus_reaches_other_processes():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        # Two buses with their own connections stand for two workers.
+        publisher = RedisBus(fakeredis.aioredis.FakeRedis(server=server))
+        subscriber = RedisBus(fakeredis.aioredis.FakeRedis(server=server))
+
+        async with subscriber.subscribe(1) as events:
+            await publisher.publish(make_event(2, 1))
+            await publisher.publish(make_event(1, 1))
+            await publisher.publish(make_event(1, 2))
+
+            received = await receive(events, 2)
+            assert [(e.room_id, e.version) for e in received] == [(1, 1), (1, 2)]
+        assert not subscriber._rooms
+        subscriber._listener.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_change_logs_return_contiguous_events_only():
+    async def scenario(log):
+        for version in (1, 3, 2, 4):
+            await log.append(make_event(1, version))
+        await log.append(make_event(2, 5))
+
+        assert [e.version for e in await log.since(1, 1, 4)] == [2, 3, 4]
+        assert await log.since(1, 4, 4) == []
+        # Version 1 has been trimmed and version 5 is not logged yet.
+        assert await log.since(1, 0, 4) is None
+        assert await log.since(1, 3, 5) is None
+
+    asyncio.run(scenario(InMemoryChangeLog(3)))
+    client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer())
+    asyncio.run(scenario(RedisChangeLog(client, 3)))
@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+
+
+def room_version(room_id):
+    from database.db import SessionLocal
+    from models import models
+
+    db = SessionLocal()
+    try:
+        return db.get(models.Room, room_id).version
+    finally:
+        db.close()
+
+
+def parse_events(body):
+    events = []
+    for chunk in filter(None, body.strip().split("\n\n")):
+        fields = dict(line.split(": ", 1) for line in chunk.split("\n"))
+        if "event" in fields:
+            events.append((int(fields["id"]), json.loads(fields["data"])))
+    return events
+
+
+def stream_now_playing(client, room_id, headers=None):
+    """Reads the stream in a thread; it ends when the client leaves the room."""
+    from events.bus import bus
+
+    result = {}
+
+    def read():
+        result["response"] = client.get("/events/now_playing", headers=headers)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    while not bus._subscribers.get(room_id):
+        time.sleep(0.01)
+
+    def finish():
+        client.delete("/disconnect").raise_for_status()
+        thread.join(5)
+        return result["response"]
+
+    return finish
+
+
+def test_now_playing_stream(make_client, make_room, seed_songs):
+    host, room, user_id = make_room("now playing")
+    seed_songs(room["id"], user_id, 3)
+    listener = make_client("now playing listener")
+    listener.post("/connect", params={"room_id": room["id"]}).raise_for_status()
+
+    finish = stream_now_playing(listener, room["id"])
+    host.patch("/playnext").raise_for_status()
+    host.patch("/swap_songs", params={"queue_num1": 2, "queue_num2": 3})
+    host.patch("/playnext").raise_for_status()
+    host.delete("/delete_song", params={"queue_num": 2}).raise_for_status()
+    response = finish()
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert [song and song["queue_num"] for _, song in events] == [None, 1, 2, None]
+    versions = [version for version, _ in events]
+    assert versions == sorted(versions)
+
+
+def test_now_playing_stream_resumes_from_last_event_id(
+    make_client, make_room, seed_songs
+):
+    host, room, user_id = make_room("now playing resume")
+    seed_songs(room["id"], user_id, 2)
+    listener = make_client("now playing resume listener")
+    listener.post("/connect", params={"room_id": room["id"]}).raise_for_status()
+    playing = host.patch("/playnext").json()
+
+    # Nothing changed since the last event: only new changes are sent.
+    finish = stream_now_playing(
+        listener, room["id"], headers={"Last-Event-ID": str(room_version(room["id"]))}
+    )
+    response = finish()
+    assert parse_events(response.text) == []
+
+    # An older id gets the current song right away.
+    listener.post("/connect", params={"room_id": room["id"]}).raise_for_status()
+    finish = stream_now_playing(
+        listener,
+        room["id"],
+        headers={"Last-Event-ID": str(room_version(room["id"]) - 1)},
+    )
+    response = finish()
+    ((_, song),) = parse_events(response.text)
+    assert song["id"] == playing["id"]
+
+
+def test_now_playing_stream_sends_heartbeats(make_room, monkeypatch):
+    from routes import event_routes
+
+    monkeypatch.setattr(event_routes, "SSE_HEARTBEAT", 0.05)
+    host, room, _ = make_room("now playing heartbeat")
+
+    finish = stream_now_playing(host, room["id"])
+    time.sleep(0.2)
+    response = finish()
+
+    assert ": heartbeat\n\n" in response.text
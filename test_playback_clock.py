@@ -0,0 +1,91 @@
+import datetime
+import time
+
+import pytest
+
+
+def offset(playing):
+    """Seconds between the song start, pauses aside, and the server time of a response."""
+    server_time = datetime.datetime.fromisoformat(playing["server_time"])
+    started_at = datetime.datetime.fromisoformat(playing["started_at"])
+    return (server_time - started_at).total_seconds()
+
+
+def test_current_song_carries_playback_clock(make_room, seed_songs):
+    host, room, user_id = make_room("clock")
+    seed_songs(room["id"], user_id, 2)
+
+    playing = host.patch("/playnext").json()
+    assert playing["paused"] is False
+    assert 0 <= playing["position"] < 1
+
+    time.sleep(0.2)
+    current = host.get("/get_current_song").json()
+    assert current["started_at"] == playing["started_at"]
+    assert current["position"] == pytest.approx(offset(current), abs=1e-3)
+    assert current["position"] >= 0.2
+
+    paused = host.patch("/pause").json()
+    assert paused["paused"] is True
+    time.sleep(0.2)
+    assert host.get("/get_current_song").json()["position"] == paused["position"]
+
+    resumed = host.patch("/resume").json()
+    assert resumed["paused"] is False
+    # The song goes on where it was paused, so it started later than it did.
+    assert resumed["position"] == pytest.approx(paused["position"], abs=0.1)
+    assert resumed["started_at"] > playing["started_at"]
+
+
+def test_pause_without_current_song(make_room):
+    host, _, _ = make_room("clock idle")
+
+    assert host.patch("/pause").status_code == 404
+
+
+def test_playnext_with_current_id_moves_on_once(make_room, seed_songs):
+    host, room, user_id = make_room("clock end")
+    seed_songs(room["id"], user_id, 3)
+    first = host.patch("/playnext").json()
+
+    # Every listener reaches the end of the song and asks to move on.
+    responses = [
+        host.patch("/playnext", params={"current_id": first["id"]}).json()
+        for _ in range(3)
+    ]
+
+    assert {response["queue_num"] for response in responses} == {2}
+
+
+def test_added_song_gets_duration(make_room, stub_resolver):
+    host, _, _ = make_room("clock duration")
+    host.post(
+        "/add_song", params={"link": "https://www.youtube.com/watch?v=dQw4w9WgXcQ"}
+    ).raise_for_status()
+
+    (song,) = host.get("/get_playlist").json()["songs"]
+    assert song["duration"] == 180
+
+
+def test_pause_and_resume_a_song_playing_before_the_clock(make_room, seed_songs):
+    from sqlalchemy import update
+
+    from database.db import SessionLocal
+    from models import models
+
+    host, room, user_id = make_room("clock backfill")
+    seed_songs(room["id"], user_id, 2)
+    host.patch("/playnext").raise_for_status()
+    with SessionLocal() as db:
+        db.execute(
+            update(models.Room)
+            .where(models.Room.id == room["id"])
+            .values(playback_started_at=None)
+        )
+        db.commit()
+
+    assert host.patch("/pause").json()["paused"] is True
+    resumed = host.patch("/resume")
+    assert resumed.status_code == 200
+    assert resumed.json()["paused"] is False
+    assert 0 <= resumed.json()["position"] < 1
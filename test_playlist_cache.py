@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+
+@pytest.fixture
+def cache(monkeypatch, app):
+    from db_methods import db_methods
+    from db_methods.playlist_cache import PlaylistCache
+    from events import bus
+
+    cache = PlaylistCache("test_playlists", maxsize=8, ttl=60)
+    monkeypatch.setattr(db_methods, "playlist_cache", cache)
+    monkeypatch.setattr(bus, "playlist_cache", cache)
+    return cache
+
+
+def reload(host, cache, room_id):
+    from routes.dependencies import encoded_responses
+
+    version = host.get("/get_playlist").json()["version"]
+    asyncio.run(cache.delete(str(room_id)))
+    asyncio.run(encoded_responses.delete(f"playlist:{room_id}:{version}"))
+    return host.get("/get_playlist").json()["songs"]
+
+
+def test_writes_go_through_the_playlist_cache(
+    make_room, seed_songs, stub_resolver, count_statements, cache
+):
+    host, room, user_id = make_room("cached playlist")
+    seed_songs(room["id"], user_id, 4)
+    host.get("/get_playlist").raise_for_status()
+
+    host.patch("/playnext").raise_for_status()
+    host.post(
+        "/add_song",
+        params={"link": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "queue_num": 2},
+    ).raise_for_status()
+    host.patch("/swap_songs", params={"queue_num1": 4, "queue_num2": 2})
+    host.delete("/delete_song", params={"queue_num": 3}).raise_for_status()
+    host.patch("/playthis", params={"queue_num": 3}).raise_for_status()
+    host.patch("/rename_user", params={"name": "renamed"}).raise_for_status()
+
+    with count_statements() as statements:
+        cached = host.get("/get_playlist").json()["songs"]
+    assert not any("FROM songs" in statement for statement in statements)
+    assert cached == reload(host, cache, room["id"])
+    # Every change was written through, so the cache never fell behind.
+    assert cache.stats["stale"] == 0
+    assert cache.info()["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_playlist_cache_reloads_stale_playlist(make_room, seed_songs, cache):
+    from database.db import SessionLocal
+    from models import models
+
+    host, room, user_id = make_room("stale playlist")
+    seed_songs(room["id"], user_id, 2)
+    host.get("/get_playlist").raise_for_status()
+
+    # Changes made without publishing, like the link refresh job, only bump the version.
+    with SessionLocal() as db:
+        db.execute(
+            update(models.Room)
+            .where(models.Room.id == room["id"])
+            .values(version=models.Room.version + 2)
+        )
+        db.execute(
+            update(models.Song)
+            .where(models.Song.room_id == room["id"])
+            .values(title="refreshed")
+        )
+        db.commit()
+
+    songs = host.get("/get_playlist").json()["songs"]
+    assert [song["title"] for song in songs] == ["refreshed", "refreshed"]
+    assert cache.stats["stale"] == 1
+    assert cache.stats["stale_versions"] == 2
+    assert host.get("/cache_stats").json()["test_playlists"]["stale"] == 1
+
+
+def strip(body, fields):
+    return {key: value for key, value in body.items() if key not in fields}
+
+
+@pytest.mark.parametrize("endpoint", ["/get_playlist", "/get_current_song"])
+def test_hot_reads_reuse_encoded_bodies(
+    endpoint, make_room, seed_songs, count_statements
+):
+    host, room, user_id = make_room(f"encoded {endpoint}")
+    seed_songs(room["id"], user_id, 3)
+    host.patch("/playnext").raise_for_status()
+    first = host.get(endpoint)
+
+    with count_statements() as statements:
+        second = host.get(endpoint)
+    assert not any("songs" in statement for statement in statements)
+    clock = ("position", "server_time")  # taken on every request
+    assert strip(second.json(), clock) == strip(first.json(), clock)
+    assert second.headers["content-type"] == "application/json"
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_workers_share_written_through_playlists():
+    import fakeredis.aioredis
+
+    from db_methods.playlist_cache import PlaylistCache
+
+    server = fakeredis.FakeServer()
+    a, b = (
+        PlaylistCache(
+            "test_shared_playlists",
+            maxsize=8,
+            ttl=60,
+            client=fakeredis.aioredis.FakeRedis(server=server),
+        )
+        for _ in range(2)
+    )
+    song = dict(id=1, title="Song 0", user=dict(id=1), queue_num=1, status=0)
+
+    async def run():
+        await a.store(7, 1, None, [song])
+        assert await b.playlist(7, 1) is not None
+        await a.apply(7, 2, [dict(version=2, op="status", id=1)])
+        # Worker b still holds version 1 in its LRU.
+        songs = await b.playlist(7, 2)
+        assert [s["status"] for s in songs] == [1]
+        await b.apply(7, 3, [dict(version=3, op="update", song=dict(id=1, title="x"))])
+        return await a.playlist(7, 3)
+
+    assert [s["title"] for s in asyncio.run(run())] == ["x"]
+    assert a.stats["stale"] == b.stats["stale"] == 0
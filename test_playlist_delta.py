@@ -0,0 +1,89 @@
+def apply(songs, ops):
+    """Applies playlist operations the way a client would."""
+    songs = [dict(song) for song in songs]
+
+    def take(song_id):
+        for i, song in enumerate(songs):
+            if song["id"] == song_id:
+                return songs.pop(i)
+
+    for op in ops:
+        if op["op"] == "insert":
+            take(op["song"]["id"])
+            songs.insert(op["song"]["queue_num"] - 1, dict(op["song"]))
+        elif op["op"] == "remove":
+            take(op["id"])
+        elif op["op"] == "move":
+            songs.insert(op["queue_num"] - 1, take(op["id"]))
+        elif op["op"] == "update":
+            for song in songs:
+                if song["id"] == op["song"]["id"]:
+                    song.update(op["song"])
+        elif op["op"] == "user":
+            for song in songs:
+                if song["user"]["id"] == op["user"]["id"]:
+                    song["user"] = op["user"]
+        elif op["op"] == "status":
+            ids = [song["id"] for song in songs]
+            playing = ids.index(op["id"])
+            for i, song in enumerate(songs):
+                song["status"] = 2 if i < playing else 1 if i == playing else 0
+    return songs
+
+
+def summary(songs):
+    return [(s["id"], s["title"], s["status"], s["user"]["name"]) for s in songs]
+
+
+def test_playlist_since_version_returns_operations(
+    make_room, seed_songs, stub_resolver
+):
+    host, room, user_id = make_room("delta")
+    seed_songs(room["id"], user_id, 4)
+    snapshot = host.get("/get_playlist").json()
+
+    host.patch("/playnext").raise_for_status()
+    host.post(
+        "/add_song",
+        params={"link": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "queue_num": 2},
+    ).raise_for_status()
+    host.patch("/swap_songs", params={"queue_num1": 4, "queue_num2": 2})
+    host.delete("/delete_song", params={"queue_num": 3}).raise_for_status()
+    host.patch("/playthis", params={"queue_num": 3}).raise_for_status()
+    host.patch("/rename_user", params={"name": "renamed"}).raise_for_status()
+
+    delta = host.get("/get_playlist", params={"since": snapshot["version"]}).json()
+    assert "songs" not in delta
+    assert [op["version"] for op in delta["ops"]] == sorted(
+        op["version"] for op in delta["ops"]
+    )
+
+    playlist = host.get("/get_playlist").json()
+    assert delta["version"] == playlist["version"]
+    assert summary(apply(snapshot["songs"], delta["ops"])) == summary(playlist["songs"])
+
+    up_to_date = host.get("/get_playlist", params={"since": playlist["version"]})
+    assert up_to_date.json() == {"version": playlist["version"], "ops": []}
+
+
+def test_playlist_since_trimmed_version_returns_snapshot(
+    make_room, seed_songs, monkeypatch
+):
+    from events import bus
+    from routes import song_routes
+
+    monkeypatch.setattr(song_routes, "changelog", bus.InMemoryChangeLog(2))
+    monkeypatch.setattr(bus, "changelog", song_routes.changelog)
+    host, room, user_id = make_room("delta trimmed")
+    seed_songs(room["id"], user_id, 4)
+    version = host.get("/get_playlist").json()["version"]
+
+    for _ in range(3):
+        host.patch("/playnext").raise_for_status()
+
+    playlist = host.get("/get_playlist", params={"since": version}).json()
+    assert [song["queue_num"] for song in playlist["songs"]] == [1, 2, 3, 4]
+    assert playlist["version"] == version + 3
+
+    delta = host.get("/get_playlist", params={"since": version + 1}).json()
+    assert len(delta["ops"]) == 2
@@ -0,0 +1,36 @@
+import pytest
+
+
+@pytest.mark.parametrize("endpoint", ["/get_playlist", "/get_current_song"])
+def test_song_reads_do_not_depend_on_playlist_length(
+    endpoint, make_room, seed_songs, count_statements
+):
+    counts = []
+    for size in (1, 40):
+        host, room, user_id = make_room(f"{endpoint} {size}")
+        seed_songs(room["id"], user_id, size)
+        host.patch("/playnext").raise_for_status()
+
+        with count_statements() as statements:
+            host.get(endpoint).raise_for_status()
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
+
+
+def test_get_roommates_does_not_depend_on_room_size(
+    make_client, make_room, count_statements
+):
+    counts = []
+    for size in (1, 10):
+        host, room, _ = make_room(f"roommates {size}")
+        for i in range(size):
+            guest = make_client(f"guest {i}")
+            guest.post("/connect", params={"room_id": room["id"]}).raise_for_status()
+
+        with count_statements() as statements:
+            users = host.get("/get_roommates").json()["users"]
+        assert len(users) == size + 1
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
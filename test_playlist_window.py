@@ -0,0 +1,59 @@
+def window(host, **params):
+    response = host.get("/get_playlist_window", params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def test_window_is_centred_on_current_song(make_room, seed_songs):
+    host, room, user_id = make_room("window")
+    seed_songs(room["id"], user_id, 30)
+    host.patch("/playthis", params={"queue_num": 12}).raise_for_status()
+    playlist = host.get("/get_playlist").json()["songs"]
+
+    centred = window(host, before=3, after=4)
+    assert centred["songs"] == playlist[8:16]
+    assert centred["songs"][3]["status"] == 1  # is_playing
+
+    older = window(host, before=5, before_cursor=centred["prev_cursor"])
+    assert older["songs"] == playlist[3:8]
+    newer = window(host, after=10, after_cursor=centred["next_cursor"])
+    assert newer["songs"] == playlist[16:26]
+    last = window(host, after=10, after_cursor=newer["next_cursor"])
+    assert last["songs"] == playlist[26:]
+    assert last["next_cursor"] is None
+    first = window(host, before=10, before_cursor=older["prev_cursor"])
+    assert first["songs"] == playlist[:3]
+    assert first["prev_cursor"] is None
+
+
+def test_window_starts_at_head_when_nothing_plays(make_room, seed_songs):
+    host, room, user_id = make_room("window idle")
+    assert window(host) == {
+        "songs": [],
+        "version": 0,
+        "prev_cursor": None,
+        "next_cursor": None,
+    }
+
+    seed_songs(room["id"], user_id, 5)
+    idle = window(host, before=2, after=2)
+    assert [song["queue_num"] for song in idle["songs"]] == [1, 2, 3]
+    assert idle["prev_cursor"] is None
+    assert idle["next_cursor"] is not None
+
+
+def test_window_does_not_depend_on_playlist_length(
+    make_room, seed_songs, count_statements
+):
+    counts = []
+    for size in (30, 300):
+        host, room, user_id = make_room(f"window {size}")
+        seed_songs(room["id"], user_id, size)
+        host.patch("/playthis", params={"queue_num": size - 10}).raise_for_status()
+
+        with count_statements() as statements:
+            songs = window(host, before=5, after=5)["songs"]
+        assert len(songs) == 11
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CLIENTS = 20
+CALLS = 10  # per client, half /playnext and half /add_song
+SEEDED = 120  # more songs than /playnext calls, so playback never wraps around
+
+
+def test_parallel_queue_mutations_keep_invariants(
+    make_client, seed_songs, stub_resolver
+):
+    host = make_client("stress host")
+    room = host.post("/create_room", params={"name": "stress"}).json()
+    seed_songs(room["id"], host.get("/whoami").json()["userid"], SEEDED)
+    clients = [host]
+    for i in range(CLIENTS - 1):
+        guest = make_client(f"stress guest {i}")
+        guest.post("/connect", params={"room_id": room["id"]}).raise_for_status()
+        clients.append(guest)
+
+    def mutate(client):
+        played = []
+        for i in range(CALLS):
+            if i % 2:
+                client.post(
+                    "/add_song",
+                    params={"link": f"https://www.youtube.com/watch?v={i:011d}"},
+                ).raise_for_status()
+            else:
+                response = client.patch("/playnext")
+                response.raise_for_status()
+                played.append(response.json()["queue_num"])
+        return played
+
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        played = [n for result in pool.map(mutate, clients) for n in result]
+
+    playnexts = CLIENTS * CALLS // 2
+    # Each /playnext moved the current song one step further, none got lost.
+    assert sorted(played) == list(range(1, playnexts + 1))
+
+    songs = host.get("/get_playlist").json()["songs"]
+    assert len(songs) == SEEDED + CLIENTS * CALLS // 2
+    assert [song["queue_num"] for song in songs] == list(range(1, len(songs) + 1))
+    assert [song["status"] for song in songs].count(1) == 1  # is_playing
+    assert host.get("/get_current_song").json()["queue_num"] == playnexts
+
+    from database.db import SessionLocal
+    from models import models
+
+    with SessionLocal() as db:
+        positions = [
+            song.position
+            for song in db.query(models.Song).filter(models.Song.room_id == room["id"])
+        ]
+    assert len(set(positions)) == len(positions)
+
+
+def test_search_phrases_do_not_lock_the_room(
+    monkeypatch, make_client, count_statements
+):
+    from routes import song_routes
+
+    async def search(query):
+        return [dict(link="https://youtu.be/dQw4w9WgXcQ", title=query, img="")]
+
+    monkeypatch.setattr(song_routes, "search", search)
+    host = make_client("search host")
+    host.post("/create_room", params={"name": "search"}).raise_for_status()
+
+    with count_statements() as statements:
+        response = host.post("/add_song", params={"link": "never gonna give you up"})
+    assert response.status_code == 449
+    assert not any("FOR UPDATE" in statement for statement in statements)
+
+
+def test_cold_link_does_not_lock_the_room(
+    monkeypatch, make_client, make_room, seed_songs, stub_resolver
+):
+    from youtube import resolver
+
+    host, room, user_id = make_room("cold link")
+    guest = make_client("cold link guest")
+    guest.post("/connect", params={"room_id": room["id"]}).raise_for_status()
+    seed_songs(room["id"], user_id, 2)
+    host.post(
+        "/add_song", params={"link": "https://youtu.be/aaaaaaaaaaa"}
+    ).raise_for_status()
+    resolving, released = threading.Event(), threading.Event()
+    fetch_stream_url = resolver.fetch_stream_url
+
+    def slow_fetch(video_id):
+        resolving.set()
+        released.wait(10)
+        return fetch_stream_url(video_id)
+
+    monkeypatch.setattr(resolver, "fetch_stream_url", slow_fetch)
+    with ThreadPoolExecutor(2) as pool:
+        played = pool.submit(host.patch, "/playthis", params={"queue_num": 3})
+        assert resolving.wait(10)
+        swapped = pool.submit(
+            guest.patch, "/swap_songs", params={"queue_num1": 1, "queue_num2": 2}
+        )
+        try:
+            # Answered while YouTube is still resolving the link of /playthis.
+            assert swapped.result(timeout=5).status_code == 200
+        finally:
+            released.set()
+        assert played.result(timeout=10).json()["video_id"] == "aaaaaaaaaaa"
+
+    current = host.get("/get_current_song").json()
+    assert "videoplayback" in current["link"]
@@ -0,0 +1,59 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+
+def room_socket(client):
+    # The session cookie is `secure`, so it is only sent over wss.
+    return client.websocket_connect("wss://testserver/ws/room")
+
+
+def test_room_socket_pushes_changes(make_client, make_room, seed_songs):
+    host, room, user_id = make_room("socket")
+    seed_songs(room["id"], user_id, 3)
+    guest = make_client("socket guest")
+
+    with room_socket(host) as socket:
+        guest.post("/connect", params={"room_id": room["id"]}).raise_for_status()
+        event = socket.receive_json()
+        assert event["kind"] == "user_joined"
+        assert event["payload"]["user"]["name"] == "socket guest"
+
+        host.patch("/playnext").raise_for_status()
+        event = socket.receive_json()
+        assert event["kind"] == "now_playing"
+        assert event["payload"]["queue_num"] == 1
+
+        host.patch(
+            "/swap_songs", params={"queue_num1": 3, "queue_num2": 2}
+        ).raise_for_status()
+        payload = socket.receive_json()["payload"]
+        assert (payload["queue_num1"], payload["queue_num2"]) == (2, 3)
+
+        host.delete("/delete_song", params={"queue_num": 2}).raise_for_status()
+        event = socket.receive_json()
+        assert event["kind"] == "song_deleted"
+        assert event["payload"]["queue_num"] == 2
+
+        guest.delete("/disconnect").raise_for_status()
+        event = socket.receive_json()
+        assert event["kind"] == "user_left"
+
+
+def test_room_events_have_consecutive_versions(make_room, seed_songs):
+    host, room, user_id = make_room("versions")
+    seed_songs(room["id"], user_id, 2)
+
+    with room_socket(host) as socket:
+        host.patch("/playnext").raise_for_status()
+        host.patch("/playnext").raise_for_status()
+        host.patch("/edit_room", params={"name": "renamed"}).raise_for_status()
+        versions = [socket.receive_json()["version"] for _ in range(3)]
+
+    assert versions[1:] == [versions[0] + 1, versions[0] + 2]
+
+
+def test_room_socket_requires_room(make_client):
+    client = make_client("socket outsider")
+    with pytest.raises(WebSocketDisconnect):
+        with room_socket(client) as socket:
+            socket.receive_json()
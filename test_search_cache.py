@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+from youtube.cache import Cache
+
+
+@pytest.fixture
+def search_module(monkeypatch):
+    from youtube import search
+
+    calls = []
+
+    def fetch_results(query):
+        calls.append(query)
+        time.sleep(0.05)
+        return [
+            {"link": "https://www.youtube.com/watch?v=x", "title": query, "img": ""}
+        ]
+
+    monkeypatch.setattr(search, "fetch_results", fetch_results)
+    monkeypatch.setattr(search, "search_cache", Cache("test_search", maxsize=8))
+    return search, calls
+
+
+def test_concurrent_identical_searches_share_one_request(search_module):
+    search, calls = search_module
+
+    async def scenario():
+        return await asyncio.gather(
+            search.search("Never gonna give you up"),
+            search.search("  never GONNA give   you up "),
+            search.search("never gonna give you up"),
+        )
+
+    results = asyncio.run(scenario())
+    assert calls == ["never gonna give you up"]
+    assert results[0] == results[1] == results[2]
+    assert search._inflight == {}
+
+
+def test_search_results_are_cached(search_module):
+    search, calls = search_module
+
+    asyncio.run(search.search("rick astley"))
+    asyncio.run(search.search("Rick Astley"))
+
+    assert calls == ["rick astley"]
+    assert search.search_cache.stats["hits"] == 1
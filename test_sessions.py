@@ -0,0 +1,50 @@
+import asyncio
+from uuid import uuid4
+
+import fakeredis.aioredis
+import pytest
+from fastapi_sessions.backends.session_backend import BackendError
+
+from FastApi_sessions.fastapi_session import RedisBackend, SessionData
+
+
+def make_backend(ttl=60):
+    return RedisBackend(fakeredis.aioredis.FakeRedis(), SessionData, ttl=ttl)
+
+
+def test_redis_backend_roundtrip():
+    async def scenario():
+        backend = make_backend()
+        session_id = uuid4()
+        data = SessionData(session_id=str(session_id))
+
+        await backend.create(session_id, data)
+        assert await backend.read(session_id) == data
+
+        with pytest.raises(BackendError):
+            await backend.create(session_id, data)
+
+        renamed = SessionData(username="kwa", userid=1, session_id=str(session_id))
+        await backend.update(session_id, renamed)
+        assert await backend.read(session_id) == renamed
+
+        await backend.delete(session_id)
+        assert await backend.read(session_id) is None
+        with pytest.raises(BackendError):
+            await backend.update(session_id, renamed)
+
+    asyncio.run(scenario())
+
+
+def test_redis_backend_read_refreshes_ttl():
+    async def scenario():
+        backend = make_backend(ttl=60)
+        session_id = uuid4()
+        await backend.create(session_id, SessionData(session_id=str(session_id)))
+
+        key = backend._key(session_id)
+        await backend._client.expire(key, 5)
+        await backend.read(session_id)
+        assert await backend._client.ttl(key) > 5
+
+    asyncio.run(scenario())
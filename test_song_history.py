@@ -0,0 +1,73 @@
+def test_played_songs_move_to_history(make_room, seed_songs):
+    from helpers import archive_played_songs
+
+    host, room, user_id = make_room("history")
+    seed_songs(room["id"], user_id, 10)
+    for _ in range(3):
+        host.patch("/playnext").raise_for_status()
+    host.patch("/playthis", params={"queue_num": 8}).raise_for_status()
+    titles = [song["title"] for song in host.get("/get_playlist").json()["songs"]]
+    etag = host.get("/get_playlist").headers["ETag"]
+
+    # Songs 1-4 have more than 3 played songs after them.
+    assert archive_played_songs(keep=3, older_than=3600, batch=3) >= 4
+
+    playlist = host.get("/get_playlist", headers={"If-None-Match": etag})
+    assert playlist.status_code == 200
+    assert [song["title"] for song in playlist.json()["songs"]] == titles[4:]
+    assert host.get("/get_current_song").json()["queue_num"] == 4
+
+    page = host.get("/get_history", params={"limit": 3}).json()
+    assert [song["title"] for song in page["songs"]] == titles[3:0:-1]
+    assert page["songs"][-1]["played_at"] is not None  # played, not skipped
+    last = host.get(
+        "/get_history", params={"limit": 3, "cursor": page["next_cursor"]}
+    ).json()
+    assert [song["title"] for song in last["songs"]] == titles[:1]
+    assert last["next_cursor"] is None
+
+
+def test_songs_played_long_ago_move_to_history(make_room, seed_songs):
+    from helpers import archive_played_songs
+
+    host, room, user_id = make_room("history age")
+    seed_songs(room["id"], user_id, 4)
+    host.patch("/playthis", params={"queue_num": 3}).raise_for_status()
+
+    archive_played_songs(keep=100, older_than=0)
+
+    songs = host.get("/get_playlist").json()["songs"]
+    assert [song["status"] for song in songs] == [1, 0]  # playing, in queue
+    assert len(host.get("/get_history").json()["songs"]) == 2
+    host.patch("/playprev").raise_for_status()  # wraps around to the last song
+
+
+def test_history_keeps_its_order_across_rebalances(
+    make_room, seed_songs, stub_resolver
+):
+    from helpers import archive_played_songs
+
+    host, room, user_id = make_room("history rebalance")
+    seed_songs(room["id"], user_id, 3)
+    host.patch("/playthis", params={"queue_num": 3}).raise_for_status()
+    archive_played_songs(keep=0, older_than=3600)
+    # Inserting at the same place runs out of gaps and renumbers the playlist,
+    # so the playing song gets a position an archived song had.
+    for i in range(12):
+        host.post(
+            "/add_song",
+            params={"link": f"https://youtu.be/{i:011d}", "queue_num": 1},
+        ).raise_for_status()
+    host.patch("/playnext").raise_for_status()
+    archive_played_songs(keep=0, older_than=3600)
+
+    songs = host.get("/get_history").json()["songs"]
+    assert [song["title"] for song in songs] == ["Song 2", "Song 1", "Song 0"]
+    pages, cursor = [], None
+    while True:
+        page = host.get("/get_history", params={"limit": 1, "cursor": cursor}).json()
+        pages += [song["title"] for song in page["songs"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == ["Song 2", "Song 1", "Song 0"]
@@ -0,0 +1,51 @@
+PLAYLIST = "https://www.youtube.com/playlist?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG"
+
+
+def test_import_appends_songs_and_reports_progress(
+    make_client, seed_songs, stub_resolver, count_statements
+):
+    host = make_client("import host")
+    room = host.post("/create_room", params={"name": "import"}).json()
+    seed_songs(room["id"], host.get("/whoami").json()["userid"], 2)
+    links = [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "https://youtu.be/unavailable",
+    ]
+
+    with count_statements() as statements:
+        response = host.post(
+            "/import_songs", json={"playlist": PLAYLIST, "links": links}
+        )
+    assert response.status_code == 202
+    # All the songs went in with a single statement.
+    assert sum("INSERT INTO songs" in statement for statement in statements) == 1
+
+    task = host.get(f"/tasks/{response.json()['task_id']}").json()
+    assert task["task_status"] == "SUCCESS"
+    assert task["task_result"]["added"] == 5
+    assert task["task_result"]["failed"] == 1
+
+    songs = host.get("/get_playlist").json()["songs"]
+    assert [song["queue_num"] for song in songs] == list(range(1, 8))
+    assert [song["title"] for song in songs[2:]] == [
+        "Title dQw4w9WgXcQ",
+        None,
+        "Title 00000000000",
+        "Title 00000000001",
+        "Title 00000000002",
+    ]
+    assert [song["resolve_state"] for song in songs[2:]] == [0, 2, 0, 0, 0]
+
+
+def test_import_rejects_other_links(make_client, stub_resolver):
+    host = make_client("bad import host")
+    host.post("/create_room", params={"name": "bad import"}).raise_for_status()
+
+    assert host.post("/import_songs", json={}).status_code == 400
+    bad = host.post("/import_songs", json={"links": ["https://example.com/song"]})
+    assert bad.status_code == 400
+    no_list = host.post(
+        "/import_songs",
+        json={"playlist": "https://www.youtube.com/watch?v=dQw4w9WgXcQ"},
+    )
+    assert no_list.status_code == 400
@@ -0,0 +1,90 @@
+import pytest
+
+
+def add_song(client, video_id, queue_num=None):
+    params = {"link": f"https://youtu.be/{video_id}"}
+    if queue_num is not None:
+        params["queue_num"] = queue_num
+    return client.post("/add_song", params=params)
+
+
+def titles(client):
+    return [song["title"] for song in client.get("/get_playlist").json()["songs"]]
+
+
+def positions(room_id):
+    from database.db import SessionLocal
+    from models import models
+
+    with SessionLocal() as db:
+        return [
+            position
+            for (position,) in db.query(models.Song.position)
+            .filter(models.Song.room_id == room_id)
+            .order_by(models.Song.position)
+        ]
+
+
+@pytest.mark.parametrize(
+    "queue_num, expected",
+    [
+        (0, ["Title aaaaaaaaaaa", "Song 0", "Song 1", "Song 2"]),
+        (2, ["Song 0", "Song 1", "Title aaaaaaaaaaa", "Song 2"]),
+        (3, ["Song 0", "Song 1", "Song 2", "Title aaaaaaaaaaa"]),
+        (None, ["Song 0", "Song 1", "Song 2", "Title aaaaaaaaaaa"]),
+    ],
+)
+def test_add_song_at_queue_num(
+    queue_num, expected, make_room, seed_songs, stub_resolver
+):
+    host, room, user_id = make_room(f"insert at {queue_num}")
+    seed_songs(room["id"], user_id, 3)
+
+    song = add_song(host, "aaaaaaaaaaa", queue_num).json()
+    assert song["queue_num"] == expected.index("Title aaaaaaaaaaa") + 1
+    assert titles(host) == expected
+
+
+@pytest.mark.parametrize("queue_num", [-1, 4])
+def test_add_song_out_of_range(queue_num, make_room, seed_songs, stub_resolver):
+    host, room, user_id = make_room(f"insert out of range {queue_num}")
+    seed_songs(room["id"], user_id, 3)
+
+    assert add_song(host, "aaaaaaaaaaa", queue_num).status_code == 404
+    assert titles(host) == ["Song 0", "Song 1", "Song 2"]
+
+
+def test_repeated_inserts_rebalance_positions(make_room, seed_songs, stub_resolver):
+    from db_methods.db_methods import POSITION_STEP
+
+    host, room, user_id = make_room("rebalance")
+    seed_songs(room["id"], user_id, 2)
+    video_ids = [f"{i:011d}" for i in range(12)]
+
+    # Each song goes right after the first one, halving the gap left there,
+    # until there is no room left and the playlist is spread out again.
+    for video_id in video_ids:
+        assert add_song(host, video_id, 1).json()["queue_num"] == 2
+    add_song(host, "aaaaaaaaaaa", 0).raise_for_status()
+
+    expected = (
+        ["Title aaaaaaaaaaa", "Song 0"]
+        + [f"Title {video_id}" for video_id in reversed(video_ids)]
+        + ["Song 1"]
+    )
+    songs = host.get("/get_playlist").json()["songs"]
+    assert [song["title"] for song in songs] == expected
+    assert [song["queue_num"] for song in songs] == list(range(1, len(expected) + 1))
+
+    spread = positions(room["id"])
+    assert len(set(spread)) == len(spread)
+    # Inserts never move other songs, so only a rebalance took the last one
+    # from its seeded position to a later step.
+    assert spread[-1] > 2 * POSITION_STEP
+    assert spread[-1] % POSITION_STEP == 0
+    assert spread[0] == spread[1] - POSITION_STEP  # the head insert
+
+    # A single song's queue_num is derived from its position as well.
+    host.patch("/playthis", params={"queue_num": 9}).raise_for_status()
+    current = host.get("/get_current_song").json()
+    assert (current["queue_num"], current["title"]) == (9, expected[8])
@@ -0,0 +1,157 @@
+def add_song(client, video_id):
+    response = client.post(
+        "/add_song", params={"link": f"https://www.youtube.com/watch?v={video_id}"}
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def test_add_song_resolves_in_background(make_room, stub_resolver):
+    host, _, _ = make_room("resolve")
+
+    song = add_song(host, "dQw4w9WgXcQ")
+    assert song["resolve_state"] == 1  # resolving
+    assert song["title"] is None
+    assert song["video_id"] == "dQw4w9WgXcQ"
+
+    # TestClient runs background tasks before returning the response.
+    (resolved,) = host.get("/get_playlist").json()["songs"]
+    assert resolved["resolve_state"] == 0  # ready
+    assert resolved["title"] == "Title dQw4w9WgXcQ"
+    # The audio link is only resolved once the song is about to be played.
+    assert resolved["link"] == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    assert stub_resolver == [("metadata", "dQw4w9WgXcQ", stub_resolver[0][2])]
+    assert stub_resolver[0][2].startswith("resolver")
+
+
+def test_add_song_marks_unresolvable_song_failed(make_room, stub_resolver):
+    host, _, _ = make_room("resolve failure")
+
+    add_song(host, "unavailable")
+
+    (song,) = host.get("/get_playlist").json()["songs"]
+    assert song["resolve_state"] == 2  # failed
+
+
+def test_playing_resolves_current_and_next_links(make_room, stub_resolver, monkeypatch):
+    from routes import song_routes
+
+    monkeypatch.setattr(song_routes, "PREFETCH_TRACKS", 1)
+    host, _, _ = make_room("lazy links")
+    for video_id in ("aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"):
+        add_song(host, video_id)
+    stub_resolver.clear()
+
+    playing = host.patch("/playnext").json()
+    assert playing["link"].startswith("https://rr1.googlevideo.com/")
+
+    links = [song["link"] for song in host.get("/get_playlist").json()["songs"]]
+    assert links[0].startswith("https://rr1.googlevideo.com/videoplayback?id=aaa")
+    assert links[1].startswith("https://rr1.googlevideo.com/videoplayback?id=bbb")
+    assert links[2] == "https://www.youtube.com/watch?v=ccccccccccc"
+
+    # Links that are still valid are not resolved again.
+    host.patch("/playthis", params={"queue_num": 1}).raise_for_status()
+    assert [call[:2] for call in stub_resolver] == [
+        ("stream", "aaaaaaaaaaa"),
+        ("stream", "bbbbbbbbbbb"),
+    ]
+
+
+def test_playing_prefetches_next_tracks(make_room, stub_resolver, monkeypatch):
+    from routes import song_routes
+
+    monkeypatch.setattr(song_routes, "PREFETCH_TRACKS", 3)
+    host, _, _ = make_room("prefetch")
+    video_ids = [f"{i}" * 11 for i in range(6)]
+    for video_id in video_ids:
+        add_song(host, video_id)
+    stub_resolver.clear()
+
+    host.patch("/playthis", params={"queue_num": 2}).raise_for_status()
+
+    resolved = {call[1] for call in stub_resolver}
+    assert resolved == set(video_ids[1:5])
+
+
+def test_playing_holds_no_connection_while_resolving(
+    make_room, stub_resolver, monkeypatch
+):
+    from sqlalchemy import text
+
+    from database.db import SessionLocal
+    from youtube import resolver
+
+    idle = []
+    fetch_stream_url = resolver.fetch_stream_url
+
+    def fetch_and_count(video_id):
+        with SessionLocal() as db:
+            idle.append(
+                db.execute(
+                    text(
+                        "SELECT count(*) FROM pg_stat_activity"
+                        " WHERE state = 'idle in transaction'"
+                    )
+                ).scalar()
+            )
+        return fetch_stream_url(video_id)
+
+    host, _, _ = make_room("prefetch connections")
+    for video_id in ("aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"):
+        add_song(host, video_id)
+    monkeypatch.setattr(resolver, "fetch_stream_url", fetch_and_count)
+
+    host.patch("/playthis", params={"queue_num": 1}).raise_for_status()
+
+    # /playthis resolves the first link itself, once it has released the room lock.
+    assert idle == [0, 0, 0]
+    songs = host.get("/get_playlist").json()["songs"]
+    assert all("googlevideo" in song["link"] for song in songs)
+
+
+def test_refresh_expiring_links_survives_deleted_songs(
+    make_room, stub_resolver, monkeypatch
+):
+    import datetime
+
+    from database.db import SessionLocal
+    from helpers import refresh_expiring_links
+    from models import models
+    from youtube import resolver
+
+    host, room, user_id = make_room("refresh links")
+    expiring = datetime.datetime.now(datetime.timezone.utc)
+    with SessionLocal() as db:
+        songs = [
+            models.Song(
+                video_id=f"{i}" * 11,
+                link="https://rr1.googlevideo.com/old",
+                link_expires_at=expiring,
+                position=i + 1,
+                room_id=room["id"],
+                user_id=user_id,
+            )
+            for i in range(3)
+        ]
+        db.add_all(songs)
+        db.commit()
+        ids = [song.id for song in songs]
+
+    fetch_stream_url = resolver.fetch_stream_url
+
+    def fetch_and_delete(video_id):
+        # Someone deletes the last song while the first link is resolved.
+        if video_id == "0" * 11:
+            host.delete("/delete_song", params={"queue_num": 3}).raise_for_status()
+        return fetch_stream_url(video_id)
+
+    monkeypatch.setattr(resolver, "fetch_stream_url", fetch_and_delete)
+    version = host.get("/get_playlist").json()["version"]
+
+    assert refresh_expiring_links() == 2
+
+    songs = host.get("/get_playlist").json()
+    assert [song["id"] for song in songs["songs"]] == ids[:2]
+    assert all("videoplayback" in song["link"] for song in songs["songs"])
+    assert songs["version"] == version + 2  # the deletion, then the new links
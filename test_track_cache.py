@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+
+from youtube.cache import Cache
+
+
+def test_cache_evicts_least_recently_used():
+    async def scenario():
+        cache = Cache("test_lru", maxsize=2)
+        expires_at = time.time() + 60
+        await cache.set("a", 1, expires_at)
+        await cache.set("b", 2, expires_at)
+        assert await cache.get("a") == 1
+        await cache.set("c", 3, expires_at)
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == 1
+        assert await cache.get("c") == 3
+        assert cache.info() == dict(
+            hits=3, redis_hits=0, misses=1, evictions=1, size=2, maxsize=2
+        )
+
+    asyncio.run(scenario())
+
+
+def test_cache_drops_expired_values():
+    async def scenario():
+        cache = Cache("test_expiry", maxsize=8)
+        await cache.set("stale", "url", time.time() - 1)
+        await cache.set("expiring", "url", time.time() + 0.05)
+        await asyncio.sleep(0.1)
+
+        assert await cache.get("stale") is None
+        assert await cache.get("expiring") is None
+        assert cache.info()["size"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cache_reads_values_written_by_other_workers():
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+
+    async def scenario():
+        client = fakeredis.FakeRedis()
+        writer = Cache("test_shared", maxsize=8, client=client)
+        reader = Cache("test_shared", maxsize=8, client=client)
+        await writer.set("dQw4w9WgXcQ", {"title": "Song"}, time.time() + 60)
+
+        assert await reader.get("dQw4w9WgXcQ") == {"title": "Song"}
+        assert await reader.get("dQw4w9WgXcQ") == {"title": "Song"}
+        assert reader.stats["redis_hits"] == 1
+        assert reader.stats["hits"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_resolver_caches_stream_until_it_expires(monkeypatch):
+    from youtube import resolver
+
+    calls = []
+    expire = {"soon": resolver.STREAM_EXPIRY_MARGIN // 2, "later": 6 * 3600}
+
+    def fetch_stream_url(video_id):
+        calls.append(video_id)
+        expires_at = int(time.time()) + expire[video_id]
+        return f"https://rr1.googlevideo.com/videoplayback?expire={expires_at}"
+
+    monkeypatch.setattr(resolver, "fetch_stream_url", fetch_stream_url)
+    monkeypatch.setattr(resolver, "stream_cache", Cache("test_stream", maxsize=8))
+
+    async def scenario():
+        for video_id in ("soon", "soon", "later", "later"):
+            await resolver.resolve_stream(video_id)
+
+    asyncio.run(scenario())
+    # Links expiring within the safety margin must not be served again.
+    assert calls == ["soon", "soon", "later"]
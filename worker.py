@@ -3,8 +3,11 @@ import os
 from celery import Celery
 from dotenv import load_dotenv
 
-from database.db import get_db
-from helpers import delete_images_not_in_db
+from helpers import (
+    archive_played_songs,
+    delete_images_not_in_db,
+    refresh_expiring_links,
+)
 
 celery = Celery(__name__)
 load_dotenv()
@@ -19,14 +22,18 @@ celery.conf.result_backend = os.environ.get(
 #     }
 # }
 
-db = get_db()
-
 
 @celery.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
     # Calls clean_images() every 30 minutes.
     sender.add_periodic_task(1800.0, clean_images, name="clean images every 30 minutes")
     sender.add_periodic_task(10.0, hello_world, name="print hello world")
+    # Calls refresh_stream_links() every 10 minutes.
+    sender.add_periodic_task(
+        600.0, refresh_stream_links, name="refresh expiring stream links"
+    )
+    # Calls archive_history() every 5 minutes.
+    sender.add_periodic_task(300.0, archive_history, name="archive played songs")
 
 
 @celery.task(name="create_task")
@@ -41,6 +48,17 @@ def clean_images():
     return True
 
 
+@celery.task(name="refresh_stream_links")
+def refresh_stream_links():
+    refresh_expiring_links()
+    return True
+
+
+@celery.task(name="archive_history")
+def archive_history():
+    return archive_played_songs()
+
+
 @celery.task(name="hello_world")
 def hello_world():
     print("Hello world!")
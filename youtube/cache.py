@@ -0,0 +1,83 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+# Every cache registers itself here, so its counters can be served by /cache_stats.
+caches: dict[str, "Cache"] = {}
+
+
+class Cache:
+    """LRU of JSON-serializable values, each with its own expiry timestamp.
+
+    With a Redis client the values are also written to Redis, so other workers
+    find them there after a miss in their own LRU. Counters in ``stats`` tell
+    apart hits in the process, hits in Redis, misses and evictions.
+    """
+
+    def __init__(self, name: str, *, maxsize: int, client=None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self._client = client
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self.stats = dict(hits=0, redis_hits=0, misses=0, evictions=0)
+        caches[name] = self
+
+    def _key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def _lookup(self, key: str) -> tuple[Optional[Any], str]:
+        """Returns the value, or None, along with the counter of the outcome."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                return value, "hits"
+            del self._entries[key]
+        value = await self._remote(key)
+        if value is not None:
+            return value, "redis_hits"
+        return None, "misses"
+
+    async def _remote(self, key: str) -> Optional[Any]:
+        """Reads the value from Redis only, and keeps it in the LRU if found."""
+        if self._client is None:
+            return None
+        raw = await self._client.get(self._key(key))
+        if raw is None:
+            return None
+        value, expires_at = json.loads(raw)
+        self._remember(key, value, expires_at)
+        return value
+
+    async def get(self, key: str) -> Optional[Any]:
+        value, outcome = await self._lookup(key)
+        self.stats[outcome] += 1
+        return value
+
+    async def set(self, key: str, value: Any, expires_at: float) -> None:
+        ttl = expires_at - time.time()
+        if ttl <= 0:
+            return
+        self._remember(key, value, expires_at)
+        if self._client is not None:
+            await self._client.set(
+                self._key(key), json.dumps([value, expires_at]), ex=math.ceil(ttl)
+            )
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._client is not None:
+            await self._client.delete(self._key(key))
+
+    def info(self) -> dict:
+        return dict(self.stats, size=len(self._entries), maxsize=self.maxsize)
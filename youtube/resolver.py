@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+from pytube import Playlist, YouTube, extract
+
+from database.redis_client import redis_client
+from youtube.cache import Cache
+
+
+class Metadata(NamedTuple):
+    title: str
+    avatar: str
+    duration: Optional[int] = None  # seconds
+
+
+class Stream(NamedTuple):
+    url: str
+    # When the link should be resolved again, a bit before it really expires.
+    expires_at: datetime.datetime
+
+
+def watch_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def thumbnail_url(video_id: str) -> str:
+    return f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
+
+
+def fetch_metadata(video_id: str) -> Metadata:
+    """Asks YouTube for the title and length of a video. Blocks."""
+    video = YouTube(watch_url(video_id))
+    return Metadata(
+        title=video.title, avatar=thumbnail_url(video_id), duration=video.length
+    )
+
+
+def fetch_stream_url(video_id: str) -> str:
+    """Asks YouTube for the audio stream of a video. Blocks."""
+    return YouTube(watch_url(video_id)).streams.filter(only_audio=True)[0].url
+
+
+def fetch_playlist_video_ids(playlist_url: str, limit: int) -> list[str]:
+    """Asks YouTube for the videos of a playlist, up to `limit` of them. Blocks."""
+    urls = itertools.islice(Playlist(playlist_url).video_urls, limit)
+    return [extract.video_id(url) for url in urls]
+
+
+# pytube makes several blocking HTTP requests per video, so it runs in a
+# bounded pool instead of on the event loop.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RESOLVER_THREADS", 4)),
+    thread_name_prefix="resolver",
+)
+
+
+async def run_in_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+# Titles and thumbnails don't change, audio links expire after a few hours.
+METADATA_TTL = int(os.environ.get("TRACK_METADATA_TTL", 30 * 24 * 3600))
+STREAM_TTL = 3600  # for links without an `expire` parameter
+STREAM_EXPIRY_MARGIN = 300
+
+cache_size = int(os.environ.get("TRACK_CACHE_SIZE", 4096))
+metadata_cache = Cache("track_metadata", maxsize=cache_size, client=redis_client)
+stream_cache = Cache("track_stream", maxsize=cache_size, client=redis_client)
+
+
+def stream_expires_at(stream_url: str) -> Optional[float]:
+    """Reads the `expire` timestamp googlevideo puts in its audio links."""
+    try:
+        return float(parse_qs(urlparse(stream_url).query)["expire"][0])
+    except (KeyError, ValueError):
+        return None
+
+
+def make_stream(stream_url: str) -> Stream:
+    expires_at = stream_expires_at(stream_url) or time.time() + STREAM_TTL
+    return Stream(
+        url=stream_url,
+        expires_at=datetime.datetime.fromtimestamp(
+            expires_at - STREAM_EXPIRY_MARGIN, datetime.timezone.utc
+        ),
+    )
+
+
+async def resolve_metadata(video_id: str) -> Metadata:
+    metadata = await metadata_cache.get(video_id)
+    if metadata is not None:
+        return Metadata(*metadata)
+    metadata = await run_in_pool(fetch_metadata, video_id)
+    await metadata_cache.set(video_id, list(metadata), time.time() + METADATA_TTL)
+    return metadata
+
+
+async def resolve_stream(video_id: str) -> Stream:
+    stream_url = await stream_cache.get(video_id)
+    if stream_url is not None:
+        return make_stream(stream_url)
+    stream = make_stream(await run_in_pool(fetch_stream_url, video_id))
+    await stream_cache.set(video_id, stream.url, stream.expires_at.timestamp())
+    return stream
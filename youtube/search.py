@@ -0,0 +1,56 @@
+import asyncio
+import os
+import time
+
+import pytube
+
+from database.redis_client import redis_client
+from youtube.cache import Cache
+from youtube.resolver import run_in_pool, thumbnail_url, watch_url
+
+SEARCH_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 600))
+SEARCH_RESULTS = 5
+
+search_cache = Cache(
+    "search",
+    maxsize=int(os.environ.get("SEARCH_CACHE_SIZE", 1024)),
+    client=redis_client,
+)
+# Searches running right now, so concurrent identical ones share one request.
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+def fetch_results(query: str) -> list[dict]:
+    """Searches YouTube and returns the top results. Blocks."""
+    return [
+        {
+            "link": watch_url(video.video_id),
+            "title": video.title,
+            "img": thumbnail_url(video.video_id),
+        }
+        for video in pytube.Search(query).results[:SEARCH_RESULTS]
+    ]
+
+
+async def _search(query: str) -> list[dict]:
+    results = await run_in_pool(fetch_results, query)
+    await search_cache.set(query, results, time.time() + SEARCH_TTL)
+    return results
+
+
+async def search(query: str) -> list[dict]:
+    query = normalize_query(query)
+    results = await search_cache.get(query)
+    if results is not None:
+        return results
+    task = _inflight.get(query)
+    if task is None:
+        task = asyncio.ensure_future(_search(query))
+        _inflight[query] = task
+        task.add_done_callback(lambda _: _inflight.pop(query, None))
+    # A cancelled caller must not cancel the search for everyone else.
+    return await asyncio.shield(task)